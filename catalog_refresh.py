@@ -0,0 +1,155 @@
+"""
+catalog_refresh.py - Re-fetch stale catalog entries from OMDb.
+
+Meant to be scheduled (e.g. daily via cron: `python main.py refresh-catalog`).
+Each call sends at most `budget` HTTP requests to OMDb (a lookup reserves
+Backoff.retries + 1 of them, as it may be retried) for the films whose data
+is oldest, looks them up `concurrency` at a time (by IMDb id, or by title and
+year for older entries without one) and writes each batch back in one transaction
+together with the run's checkpoint. An interrupted or budget-limited run is
+resumed by the next call; a run ends once no entry older than its cutoff
+is left.
+
+Public API:
+- refresh_catalog(max_age_days=30, budget=900, concurrency=4, batch_size=100,
+  client=None, progress=None) -> RefreshReport
+"""
+
+from __future__ import annotations
+
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple, TypedDict
+
+import movie_api
+from storage import movie_storage_sql as movie_storage
+from storage.movie_storage_sql import CatalogMovie, CatalogRefresh, PageCursor
+from storage.omdb_cache import get_cache, normalize_title
+
+DEFAULT_MAX_AGE_DAYS = 30
+DEFAULT_BUDGET = 900              # OMDb's free key allows 1000 requests a day
+DEFAULT_CONCURRENCY = 4
+DEFAULT_BATCH_SIZE = 100
+
+
+class RefreshReport(TypedDict):
+  run_id: int
+  processed: int        # totals of the whole run, including earlier calls
+  updated: int
+  failed: int
+  requests: int         # HTTP requests sent to OMDb by this call (retries included)
+  finished: bool        # False: budget used up or API unavailable, resume later
+
+
+Lookup = Tuple[Optional[movie_api.FetchedMovie], Optional[movie_api.ApiConnectionError]]
+
+
+def _lookup(client: movie_api.OmdbClient, movie: CatalogMovie) -> Lookup:
+  """Fetch one entry, bypassing the response cache; (None, None) = not found.
+
+  A title lookup only counts if OMDb returns the same title and year;
+  anything else is a different film (e.g. a remake) and must not be merged.
+  """
+  try:
+    if movie["imdb_id"]:
+      return client.fetch_by_id(movie["imdb_id"], refresh=True), None
+    fetched = client.fetch(movie["title"], refresh=True, year=movie["year"])
+    if (normalize_title(fetched["title"]), fetched["year"]) != (
+      normalize_title(movie["title"]), movie["year"]
+    ):
+      return None, None
+    return fetched, None
+  except movie_api.MovieNotFoundError:
+    return None, None
+  except movie_api.ApiConnectionError as error:
+    return None, error
+
+
+def _report(run: movie_storage.RefreshRun, requests: int, finished: bool) -> RefreshReport:
+  return {
+    "run_id": run["id"],
+    "processed": run["processed"],
+    "updated": run["updated"],
+    "failed": run["failed"],
+    "requests": requests,
+    "finished": finished,
+  }
+
+
+def refresh_catalog(
+  max_age_days: float = DEFAULT_MAX_AGE_DAYS,
+  budget: int = DEFAULT_BUDGET,
+  concurrency: int = DEFAULT_CONCURRENCY,
+  batch_size: int = DEFAULT_BATCH_SIZE,
+  client: Optional[movie_api.OmdbClient] = None,
+  progress: Optional[Callable[[RefreshReport], None]] = None,
+) -> RefreshReport:
+  """Refresh catalog entries older than `max_age_days`, stalest first.
+
+  Entries that fail with a connection error are skipped for this run (they
+  stay stale and come first in the next one). The call stops after a batch
+  in which the circuit breaker blocked a lookup; the run resumes at the
+  first blocked entry. `progress` is called after every batch.
+  """
+  if concurrency < 1 or batch_size < 1:
+    raise ValueError("concurrency und batch_size müssen mindestens 1 sein.")
+  if max_age_days < 0 or budget < 0:
+    raise ValueError("max_age_days und budget dürfen nicht negativ sein.")
+
+  own_client = client is None
+  active_client = client or movie_api.OmdbClient(pool_size=concurrency, cache=get_cache())
+  run = movie_storage.open_refresh_run(max_age_days * 24 * 3600)
+  sent_before = active_client.requests_sent
+  attempts = active_client.backoff.retries + 1
+  finished = False
+
+  def requests() -> int:
+    return active_client.requests_sent - sent_before
+
+  try:
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+      while True:
+        limit = min(batch_size, (budget - requests()) // attempts)
+        if limit < 1:
+          break
+        batch = movie_storage.refresh_candidates(run, limit=limit)
+        if not batch:
+          movie_storage.finish_refresh_run(run)
+          finished = True
+          break
+
+        outcomes = list(executor.map(lambda movie: _lookup(active_client, movie), batch))
+        results: List[CatalogRefresh] = []
+        cursor: PageCursor = run["cursor"]
+        failed = 0
+        circuit_open = False
+        for movie, (fetched, error) in zip(batch, outcomes):
+          if isinstance(error, movie_api.CircuitOpenError):
+            circuit_open = True     # not attempted; the checkpoint stays before it
+            continue
+          if not circuit_open:
+            cursor = (movie["refreshed_at"] or 0.0, movie["id"])
+          if error is not None:
+            if not circuit_open:    # otherwise retried when the run resumes
+              failed += 1
+          elif fetched is None:
+            results.append({"id": movie["id"], "imdb_id": "", "rating": None, "poster": ""})
+          else:
+            results.append({
+              "id": movie["id"],
+              "imdb_id": fetched["imdb_id"],
+              "rating": fetched["rating"],
+              "poster": fetched["poster"],
+            })
+
+        # Results behind the checkpoint are saved too: being fresh now, they
+        # are no longer candidates when the run resumes.
+        movie_storage.save_refresh_batch(run, results, cursor, failed)
+        if progress is not None:
+          progress(_report(run, requests(), False))
+        if circuit_open:
+          break
+  finally:
+    if own_client:
+      active_client.close()
+
+  return _report(run, requests(), finished)
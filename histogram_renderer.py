@@ -0,0 +1,189 @@
+"""
+histogram_renderer.py - Render rating histograms from precomputed bin counts.
+
+Works on the bucket counts from storage.rating_histogram(), bucket i being
+the ratings in [i, i + 1). Nothing here imports matplotlib unless the "agg"
+backend is asked for, so export takes milliseconds and runs headless.
+
+Formats:
+- text/ANSI bars for the terminal (render_text)
+- SVG, written directly (render_svg)
+- PNG, encoded with zlib, bars and axes only (render_png)
+- anything matplotlib supports, via its Agg backend (backend="agg")
+"""
+
+from __future__ import annotations
+
+import struct
+import zlib
+from html import escape
+from pathlib import Path
+from typing import Sequence, Tuple
+
+DEFAULT_TITLE = "film rating Histogram"
+BAR_COLOR: Tuple[int, int, int] = (0, 155, 80)   # matches .list-movies-title in style.css
+AXIS_COLOR: Tuple[int, int, int] = (0, 0, 0)
+
+_ANSI_BAR = "\033[32m"
+_ANSI_RESET = "\033[0m"
+
+
+def _bucket_label(index: int) -> str:
+  return f"{index}-{index + 1}"
+
+
+def render_text(counts: Sequence[int], width: int = 40, color: bool = False) -> str:
+  """Render one line per bucket: label, bar scaled to `width`, count."""
+  peak = max(counts, default=0) or 1
+  label_width = len(_bucket_label(len(counts) - 1)) if counts else 0
+  lines = []
+  for index, count in enumerate(counts):
+    bar = "█" * round(count / peak * width)
+    if color and bar:
+      bar = f"{_ANSI_BAR}{bar}{_ANSI_RESET}"
+    lines.append(f"{_bucket_label(index):>{label_width}} | {bar} {count}")
+  return "\n".join(lines)
+
+
+def render_svg(
+  counts: Sequence[int],
+  title: str = DEFAULT_TITLE,
+  width: int = 640,
+  height: int = 400,
+) -> str:
+  """Render the histogram as a standalone SVG document."""
+  left, right, top, bottom = 50, 20, 40, 40
+  plot_width = width - left - right
+  plot_height = height - top - bottom
+  peak = max(counts, default=0) or 1
+  bar_width = plot_width / max(len(counts), 1)
+  fill = "#{:02x}{:02x}{:02x}".format(*BAR_COLOR)
+
+  parts = [
+    f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}"'
+    f' viewBox="0 0 {width} {height}" font-family="sans-serif" font-size="12">',
+    f'<rect width="{width}" height="{height}" fill="white"/>',
+    f'<text x="{width / 2}" y="{top / 2 + 6}" text-anchor="middle" font-size="16">'
+    f"{escape(title)}</text>",
+  ]
+  for index, count in enumerate(counts):
+    bar_height = count / peak * plot_height
+    x = left + index * bar_width
+    parts.append(
+      f'<rect x="{x:.1f}" y="{top + plot_height - bar_height:.1f}" width="{bar_width:.1f}"'
+      f' height="{bar_height:.1f}" fill="{fill}" stroke="black"/>'
+    )
+    parts.append(
+      f'<text x="{x + bar_width / 2:.1f}" y="{height - bottom + 16}"'
+      f' text-anchor="middle">{_bucket_label(index)}</text>'
+    )
+  parts += [
+    f'<line x1="{left}" y1="{top + plot_height}" x2="{width - right}" y2="{top + plot_height}"'
+    ' stroke="black"/>',
+    f'<line x1="{left}" y1="{top}" x2="{left}" y2="{top + plot_height}" stroke="black"/>',
+    f'<text x="{left - 6}" y="{top + 4}" text-anchor="end">{peak}</text>',
+    f'<text x="{left - 6}" y="{top + plot_height + 4}" text-anchor="end">0</text>',
+    f'<text x="{left + plot_width / 2}" y="{height - 6}" text-anchor="middle">rating</text>',
+    f'<text x="14" y="{top + plot_height / 2}" text-anchor="middle"'
+    f' transform="rotate(-90 14 {top + plot_height / 2})">count</text>',
+    "</svg>",
+  ]
+  return "\n".join(parts)
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+  return (
+    struct.pack(">I", len(data))
+    + kind
+    + data
+    + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+  )
+
+
+def render_png(counts: Sequence[int], width: int = 640, height: int = 400) -> bytes:
+  """Encode the bars and axes as an RGB PNG (no text, no dependencies)."""
+  margin = 20
+  plot_width = width - 2 * margin
+  plot_height = height - 2 * margin
+  peak = max(counts, default=0) or 1
+  bar_width = plot_width / max(len(counts), 1)
+
+  bars = []
+  for index, count in enumerate(counts):
+    x0 = margin + round(index * bar_width)
+    x1 = margin + round((index + 1) * bar_width)
+    bars.append((x0, x1, height - margin - round(count / peak * plot_height)))
+
+  background = bytes((255, 255, 255))
+  bar_pixel = bytes(BAR_COLOR)
+  axis_pixel = bytes(AXIS_COLOR)
+  raw = bytearray()
+  for y in range(height):
+    row = bytearray(background * width)
+    if margin <= y < height - margin:
+      for x0, x1, bar_top in bars:
+        if y >= bar_top:
+          row[x0 * 3:x1 * 3] = bar_pixel * (x1 - x0)
+          row[x0 * 3:x0 * 3 + 3] = axis_pixel       # bar outline
+          row[(x1 - 1) * 3:x1 * 3] = axis_pixel
+        elif y == bar_top - 1 and x1 > x0:
+          row[x0 * 3:x1 * 3] = axis_pixel * (x1 - x0)
+      row[margin * 3:margin * 3 + 3] = axis_pixel   # y axis
+    elif y == height - margin:
+      row[margin * 3:(width - margin) * 3] = axis_pixel * (width - 2 * margin)  # x axis
+    raw += b"\x00" + row
+
+  header = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+  return (
+    b"\x89PNG\r\n\x1a\n"
+    + _png_chunk(b"IHDR", header)
+    + _png_chunk(b"IDAT", zlib.compress(bytes(raw), 6))
+    + _png_chunk(b"IEND", b"")
+  )
+
+
+def _save_with_agg(counts: Sequence[int], path: Path, title: str) -> None:
+  """Render through matplotlib's Agg canvas (no pyplot, no GUI backend)."""
+  # pylint: disable=import-outside-toplevel
+  from matplotlib.backends.backend_agg import FigureCanvasAgg
+  from matplotlib.figure import Figure
+
+  figure = Figure()
+  FigureCanvasAgg(figure)
+  axes = figure.add_subplot()
+  axes.bar(range(len(counts)), counts, width=1.0, align="edge", edgecolor="black")
+  axes.set_title(title)
+  axes.set_xlabel("rating")
+  axes.set_ylabel("count")
+  figure.tight_layout()
+  figure.savefig(path)
+
+
+def save_histogram(
+  counts: Sequence[int],
+  filename: str,
+  title: str = DEFAULT_TITLE,
+  backend: str = "auto",
+) -> Path:
+  """Write the histogram to `filename` and return the path written.
+
+  backend "auto" writes .svg and .png directly and uses matplotlib's Agg
+  backend for other formats; "agg" always uses matplotlib. A name without
+  extension gets ".png", like matplotlib's savefig.
+  Raises ImportError if matplotlib is needed but missing, OSError on I/O errors.
+  """
+  if backend not in ("auto", "agg"):
+    raise ValueError(f"Unbekanntes Backend: {backend!r}")
+
+  path = Path(filename)
+  if not path.suffix:
+    path = path.with_suffix(".png")
+  suffix = path.suffix.lower()
+
+  if backend == "agg" or suffix not in (".svg", ".png"):
+    _save_with_agg(counts, path, title)
+  elif suffix == ".svg":
+    path.write_text(render_svg(counts, title), encoding="utf-8")
+  else:
+    path.write_bytes(render_png(counts))
+  return path
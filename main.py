@@ -10,30 +10,22 @@ Robustness requirements:
 
 from __future__ import annotations
 
-import difflib
-import random
-import statistics
-from typing import Optional
+import argparse
+import sys
+from typing import Iterable, Iterator, Optional
 
+from storage import analytics
 from storage import movie_storage_sql as movie_storage
-from storage.movie_storage_sql import MovieData
 
+import catalog_refresh
+import histogram_renderer
 import movie_api
+import site_builder
 import website_generator
 
 
-def normalize(text: str) -> str:
-  """Normalize text for case-insensitive comparisons."""
-  return text.strip().lower()
-
-
-def find_exact_key_case_insensitive(movies: MovieData, title: str) -> Optional[str]:
-  """Find the real movie key ignoring case."""
-  normalized_title = normalize(title)
-  for key in movies:
-    if normalize(key) == normalized_title:
-      return key
-  return None
+SEARCH_LIMIT = 50
+TOP_N = 20
 
 
 def print_title() -> None:
@@ -56,6 +48,7 @@ def print_menu() -> None:
   print("9. Generate website")
   print("10. Switch user")
   print("11. rating histogram")
+  print(f"12. Top {TOP_N} Filme")
 
 
 def ask_non_empty(prompt: str) -> str:
@@ -77,14 +70,19 @@ def ask_float(prompt: str) -> float:
       print("Ungültige Zahl. Bitte nochmal.")
 
 
-def ask_int(prompt: str) -> int:
-  """Ask until a valid integer is entered."""
+def ask_int(prompt: str, minimum: Optional[int] = None, maximum: Optional[int] = None) -> int:
+  """Ask until a valid integer (within minimum..maximum, if given) is entered."""
   while True:
     raw_value = input(prompt).strip()
     try:
-      return int(raw_value)
+      value = int(raw_value)
     except ValueError:
       print("Ungültige Zahl. Bitte nochmal.")
+      continue
+    if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+      print(f"Bitte eine Zahl zwischen {minimum} und {maximum} eingeben.")
+      continue
+    return value
 
 
 def ask_choice(prompt: str, valid_choices: set[str]) -> str:
@@ -127,22 +125,20 @@ def select_or_create_user() -> tuple[int, str]:
 
 def list_movies(user_id: int, user_name: str) -> None:
   """List all movies for the active user."""
-  movies = movie_storage.get_movies(user_id)
-  if not movies:
+  count = movie_storage.count_movies(user_id)
+  if not count:
     print(f"📢 {user_name}, deine Filmsammlung ist leer. Füge Filme hinzu!")
     return
 
-  print(f"{len(movies)} movies total")
-  for title, data in movies.items():
+  print(f"{count} movies total")
+  for title, data in movie_storage.iter_movies(user_id):
     print(f"{title} ({data['year']}): {data['rating']}")
 
 
 def add_movie(user_id: int) -> None:
   """Add a movie for the active user (title only; API + fallback)."""
-  movies = movie_storage.get_movies(user_id)
-
   title = ask_non_empty("film name eingeben: ")
-  if find_exact_key_case_insensitive(movies, title):
+  if movie_storage.movie_exists(user_id, title):
     print("Film existiert bereits.")
     return
 
@@ -154,6 +150,7 @@ def add_movie(user_id: int) -> None:
       fetched["year"],
       fetched["rating"],
       fetched["poster"],
+      imdb_id=fetched["imdb_id"] or None,
     )
     print(f"✅ \"{fetched['title']}\" added successfully.")
     return
@@ -164,7 +161,7 @@ def add_movie(user_id: int) -> None:
 
   except movie_api.ApiConnectionError:
     print("API ist aktuell nicht erreichbar. Manuelle Eingabe wird verwendet.")
-    year = ask_int("erscheinungsjahr: ")
+    year = ask_int("erscheinungsjahr: ", movie_storage.YEAR_MIN, movie_storage.YEAR_MAX)
     rating = ask_float("film rating 1-10: ")
     poster = ""
     movie_storage.add_movie(user_id, title, year, rating, poster)
@@ -175,11 +172,10 @@ def add_movie(user_id: int) -> None:
 def delete_movie(user_id: int) -> None:
   """Delete a movie for the active user."""
   while True:
-    movies = movie_storage.get_movies(user_id)
-
     title = ask_non_empty("film name: ")
-    existing = find_exact_key_case_insensitive(movies, title)
-    if existing:
+    found = movie_storage.find_movie(user_id, title)
+    if found:
+      existing = found[0]
       movie_storage.delete_movie(user_id, existing)
       print(f"\"{existing}\" gelöscht.")
       return
@@ -189,43 +185,22 @@ def delete_movie(user_id: int) -> None:
 def update_movie(user_id: int) -> None:
   """Update a movie rating for the active user."""
   while True:
-    movies = movie_storage.get_movies(user_id)
-
     title = ask_non_empty("filmname: ")
-    existing = find_exact_key_case_insensitive(movies, title)
-    if not existing:
+    found = movie_storage.find_movie(user_id, title)
+    if not found:
       print("Film existiert nicht. Bitte nochmal.")
       continue
 
+    existing = found[0]
     rating = ask_float("neues rating: ")
     movie_storage.update_movie(user_id, existing, rating)
     print(f"\"{existing}\" aktualisiert.")
     return
 
 
-def compute_stats(movies: MovieData) -> Optional[dict[str, float | list[str]]]:
-  """Compute rating statistics."""
-  if not movies:
-    return None
-
-  ratings = [data["rating"] for data in movies.values()]
-  max_rating = max(ratings)
-  min_rating = min(ratings)
-
-  return {
-    "avg": sum(ratings) / len(ratings),
-    "median": statistics.median(ratings),
-    "max": max_rating,
-    "min": min_rating,
-    "best": [t for t, d in movies.items() if d["rating"] == max_rating],
-    "worst": [t for t, d in movies.items() if d["rating"] == min_rating],
-  }
-
-
 def stats(user_id: int, user_name: str) -> None:
-  """Display statistics for the active user."""
-  movies = movie_storage.get_movies(user_id)
-  result = compute_stats(movies)
+  """Display statistics for the active user (aggregated inside SQLite)."""
+  result = movie_storage.rating_stats(user_id)
 
   if not result:
     print(f"📢 {user_name}, keine filme in deiner datenbank.")
@@ -240,37 +215,41 @@ def stats(user_id: int, user_name: str) -> None:
   for title in result["worst"]:
     print(f"- {title}")
 
+  if not analytics.HAS_NUMPY:
+    return
+  summary = analytics.analyze_user(user_id)
+  if summary is None:
+    return
+  print(f"standardabweichung: {summary['std']:.2f}")
+  percentiles = ", ".join(f"p{p} {value:.2f}" for p, value in summary["percentiles"].items())
+  print(f"perzentile: {percentiles}")
+  print("nach jahrzehnt:")
+  for decade, decade_stats in sorted(summary["decades"].items()):
+    print(f"- {decade}er: {decade_stats['count']} filme, ø {decade_stats['mean']:.2f}")
+
 
 def random_movie(user_id: int) -> None:
   """Print a random movie for the active user."""
-  movies = movie_storage.get_movies(user_id)
-  if not movies:
+  picked = movie_storage.random_movie(user_id)
+  if not picked:
     print("keine filme in datenbank")
     return
 
-  title = random.choice(list(movies))
-  data = movies[title]
+  title, data = picked[0]
   print(f"{title} ({data['year']}): {data['rating']}")
 
 
 def search_movie(user_id: int) -> None:
   """Search for movies by title for the active user."""
-  movies = movie_storage.get_movies(user_id)
-
   query = ask_non_empty("filmname: ")
-  normalized_query = normalize(query)
-
-  matches = [
-    (t, d) for t, d in movies.items()
-    if normalized_query in normalize(t)
-  ]
 
+  matches = movie_storage.search_movies(user_id, query, limit=SEARCH_LIMIT)
   if matches:
     for title, data in matches:
       print(f"{title} ({data['year']}): {data['rating']}")
     return
 
-  suggestions = difflib.get_close_matches(query, movies.keys(), n=5, cutoff=0.6)
+  suggestions = movie_storage.suggest_titles(user_id, query, n=5, cutoff=0.6)
   print("Film nicht gefunden.")
   if suggestions:
     print("Meinst du:")
@@ -280,59 +259,158 @@ def search_movie(user_id: int) -> None:
 
 def movies_sorted_by_rating(user_id: int) -> None:
   """List movies sorted by rating for the active user."""
-  movies = movie_storage.get_movies(user_id)
+  if not movie_storage.count_movies(user_id):
+    print("keine filme in datenbank")
+    return
+
+  for title, data in movie_storage.iter_movies(user_id, order_by="rating"):
+    print(f"{title} ({data['year']}): {data['rating']}")
+
+
+def top_movies(user_id: int) -> None:
+  """List the best rated movies of the active user."""
+  movies = movie_storage.top_movies(user_id, TOP_N)
   if not movies:
     print("keine filme in datenbank")
     return
 
-  for title, data in sorted(
-    movies.items(),
-    key=lambda item: item[1]["rating"],
-    reverse=True,
-  ):
+  for title, data in movies:
     print(f"{title} ({data['year']}): {data['rating']}")
 
 
 def rating_histogram(user_id: int) -> None:
-  """Save a histogram of ratings to a file for the active user."""
-  movies = movie_storage.get_movies(user_id)
-  if not movies:
+  """Show a histogram of ratings and save it to a file for the active user."""
+  counts = movie_storage.rating_histogram(user_id)
+  if not any(counts):
     print("keine filme in datenbank")
     return
 
-  filename = ask_non_empty("dateiname um histogram zu speichern: ")
+  print(histogram_renderer.render_text(counts, color=sys.stdout.isatty()))
+  filename = ask_non_empty("dateiname um histogram zu speichern (.svg/.png): ")
 
   try:
-    import matplotlib.pyplot as plt  # pylint: disable=import-outside-toplevel
+    path = histogram_renderer.save_histogram(counts, filename)
+    print(f"Histogram gespeichert zu {path}")
   except ImportError:
-    print("matplotlib is not available.")
+    print("matplotlib is not available (nur .svg und .png ohne matplotlib).")
+  except OSError as error:
+    print(f"konnte histogram nicht speichern: {error}")
+
+
+def check_stats(rebuild: bool) -> None:
+  """Report users whose stats summary is out of date; optionally rebuild it."""
+  stale = movie_storage.check_user_stats()
+  if not stale:
+    print("Stats sind konsistent.")
     return
 
-  ratings = [data["rating"] for data in movies.values()]
+  print(f"Veraltete Stats für {len(stale)} User: {', '.join(map(str, stale))}")
+  if rebuild:
+    movie_storage.rebuild_user_stats()
+    print("Stats neu aufgebaut.")
 
+
+def read_titles(lines: Iterable[str]) -> Iterator[str]:
+  """Yield the titles of a text file, one per line (blank lines and # comments skipped)."""
+  for line in lines:
+    title = line.strip()
+    if title and not title.startswith("#"):
+      yield title
+
+
+def import_titles(path: str, user_name: str, concurrency: int) -> None:
+  """Look up all titles of a file on OMDb concurrently and store the hits."""
   try:
-    plt.figure()
-    plt.hist(ratings, bins=10)
-    plt.title("film rating Histogram")
-    plt.xlabel("rating")
-    plt.ylabel("count")
-    plt.tight_layout()
-    plt.savefig(filename)
-    plt.close()
-    print(f"Histogram gespeichert zu {filename}")
+    handle = open(path, encoding="utf-8")  # pylint: disable=consider-using-with
   except OSError as error:
-    print(f"konnte histogram nicht speichern: {error}")
+    print(f"konnte datei nicht lesen: {error}")
+    return
+
+  with handle:
+    _import_titles(handle, user_name, concurrency)
+
+
+def _import_titles(lines: Iterable[str], user_name: str, concurrency: int) -> None:
+  user_id = movie_storage.get_user_id(user_name)
+  if user_id is None:
+    user_id = movie_storage.create_user(user_name)
+    print(f"User '{user_name}' erstellt.")
+
+  failed: dict[str, list[str]] = {"not_found": [], "connection_error": []}
+
+  def found_movies() -> Iterator[movie_api.FetchedMovie]:
+    for done, result in enumerate(movie_api.fetch_movies(read_titles(lines), concurrency), start=1):
+      if result["movie"] is not None:
+        yield result["movie"]
+      else:
+        failed[result["status"]].append(result["query"])
+      if done % 100 == 0:
+        print(f"{done} Titel abgefragt ...")
+
+  try:
+    result = movie_storage.add_movies_bulk(user_id, found_movies())
+  except (OSError, UnicodeDecodeError) as error:
+    print(f"konnte datei nicht lesen: {error}")
+    return
+
+  print(f"{result['inserted']} Filme importiert, {result['skipped']} bereits vorhanden.")
+  if failed["not_found"]:
+    print(f"Nicht gefunden ({len(failed['not_found'])}): {', '.join(failed['not_found'])}")
+  if failed["connection_error"]:
+    print(
+      f"API-Fehler ({len(failed['connection_error'])}): "
+      f"{', '.join(failed['connection_error'])}"
+    )
 
 
-def main() -> None:
-  """Run the CLI loop."""
+def refresh_catalog(max_age_days: float, budget: int, concurrency: int) -> None:
+  """Re-fetch stale catalog entries from OMDb (resumes an interrupted run)."""
+  def show(report: catalog_refresh.RefreshReport) -> None:
+    print(
+      f"{report['processed']} geprüft, {report['updated']} aktualisiert, "
+      f"{report['failed']} fehlgeschlagen ..."
+    )
+
+  report = catalog_refresh.refresh_catalog(
+    max_age_days=max_age_days,
+    budget=budget,
+    concurrency=concurrency,
+    progress=show,
+  )
+  print(
+    f"Lauf {report['run_id']}: {report['requests']} Anfragen, "
+    f"{report['processed']} geprüft, {report['updated']} aktualisiert."
+  )
+  if not report["finished"]:
+    print("Noch nicht fertig; der nächste Aufruf macht weiter.")
+
+
+def build_sites(jobs: Optional[int], force: bool) -> None:
+  """Generate the websites of all users in parallel, plus the user index."""
+  def show(done: int, total: int) -> None:
+    print(f"{done}/{total} Seiten ...")
+
+  try:
+    report = site_builder.build_sites(jobs=jobs, force=force, progress=show)
+  except FileNotFoundError as error:
+    print(error)
+    return
+  print(
+    f"{report['users']} User: {report['written']} Seiten geschrieben, "
+    f"{report['unchanged']} unverändert. Index: "
+    f"{website_generator.STATIC_DIR / website_generator.INDEX_FILENAME}"
+  )
+
+
+def run_menu() -> None:
+  """Run the interactive CLI loop."""
   print_title()
-  valid_choices = {str(i) for i in range(12)}
+  valid_choices = {str(i) for i in range(13)}
   user_id, user_name = select_or_create_user()
 
   while True:
     print_menu()
-    choice = ask_choice("wähle (0-11): ", valid_choices)
+    choice = ask_choice("wähle (0-12): ", valid_choices)
     print()
 
     if choice == "1":
@@ -352,18 +430,24 @@ def main() -> None:
     elif choice == "8":
       movies_sorted_by_rating(user_id)
     elif choice == "9":
-      movies = movie_storage.get_movies(user_id)
-      filename = f"{user_name}.html"
-      website_generator.generate_website(
-        movies,
-        app_title=f"{user_name}'s Movie App",
-        filename=filename,
+      written = website_generator.generate_website(
+        movie_storage.iter_movies(user_id, order_by="rating"),
+        app_title=site_builder.page_title(user_name),
+        filename=site_builder.page_filename(user_name),
+        revision=website_generator.PageRevision(
+          movie_storage.database_id(), user_id, movie_storage.user_revision(user_id),
+        ),
       )
-      print("Website was generated successfully.")
+      if written:
+        print("Website was generated successfully.")
+      else:
+        print("Website ist bereits aktuell.")
     elif choice == "10":
       user_id, user_name = select_or_create_user()
     elif choice == "11":
       rating_histogram(user_id)
+    elif choice == "12":
+      top_movies(user_id)
     elif choice == "0":
       print("Bye!")
       break
@@ -371,5 +455,113 @@ def main() -> None:
     print()
 
 
+def positive_int(value: str) -> int:
+  """argparse type: an integer >= 1."""
+  number = int(value)
+  if number < 1:
+    raise argparse.ArgumentTypeError(f"muss mindestens 1 sein: {value}")
+  return number
+
+
+def non_negative_int(value: str) -> int:
+  """argparse type: an integer >= 0."""
+  number = int(value)
+  if number < 0:
+    raise argparse.ArgumentTypeError(f"darf nicht negativ sein: {value}")
+  return number
+
+
+def non_negative_float(value: str) -> float:
+  """argparse type: a number >= 0."""
+  number = float(value)
+  if not number >= 0:
+    raise argparse.ArgumentTypeError(f"darf nicht negativ sein: {value}")
+  return number
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+  """Run the interactive menu, or a maintenance command if one is given."""
+  parser = argparse.ArgumentParser(description="Film Datenbank")
+  commands = parser.add_subparsers(dest="command")
+
+  check_parser = commands.add_parser(
+    "check-stats",
+    help="compare the stats summary tables with the movies table",
+  )
+  check_parser.add_argument(
+    "--rebuild",
+    action="store_true",
+    help="rebuild the summary tables if they are out of date",
+  )
+
+  import_parser = commands.add_parser(
+    "import-titles",
+    help="look up a file of titles (one per line) on OMDb and store them",
+  )
+  import_parser.add_argument("file", help="text file with one movie title per line")
+  import_parser.add_argument("--user", required=True, help="user name (created if missing)")
+  import_parser.add_argument(
+    "--concurrency",
+    type=positive_int,
+    default=movie_api.DEFAULT_CONCURRENCY,
+    help="parallel OMDb requests (default: %(default)s)",
+  )
+
+  refresh_parser = commands.add_parser(
+    "refresh-catalog",
+    help="re-fetch stale ratings and posters from OMDb (resumable, for cron)",
+  )
+  refresh_parser.add_argument(
+    "--max-age-days",
+    type=non_negative_float,
+    default=catalog_refresh.DEFAULT_MAX_AGE_DAYS,
+    help="refresh entries older than this (default: %(default)s)",
+  )
+  refresh_parser.add_argument(
+    "--budget",
+    type=non_negative_int,
+    default=catalog_refresh.DEFAULT_BUDGET,
+    help="maximum number of HTTP requests to OMDb, retries included (default: %(default)s)",
+  )
+  refresh_parser.add_argument(
+    "--concurrency",
+    type=positive_int,
+    default=catalog_refresh.DEFAULT_CONCURRENCY,
+    help="parallel OMDb requests (default: %(default)s)",
+  )
+
+  build_parser = commands.add_parser(
+    "build-sites",
+    help="generate the websites of all users and an index page",
+  )
+  build_parser.add_argument(
+    "--jobs",
+    type=positive_int,
+    default=None,
+    help="worker processes (default: number of CPUs)",
+  )
+  build_parser.add_argument(
+    "--force",
+    action="store_true",
+    help="rewrite every page, even if unchanged",
+  )
+
+  args = parser.parse_args(argv)
+  if args.command == "check-stats":
+    check_stats(args.rebuild)
+    return
+  if args.command == "import-titles":
+    import_titles(args.file, args.user, args.concurrency)
+    return
+  if args.command == "refresh-catalog":
+    refresh_catalog(args.max_age_days, args.budget, args.concurrency)
+    return
+  if args.command == "build-sites":
+    build_sites(args.jobs, args.force)
+    return
+
+  run_menu()
+
+
 if __name__ == "__main__":
   main()
@@ -2,24 +2,77 @@
 movie_api.py - Fetch movie info from OMDb API.
 
 Hardcoded API key (no .env).
-Fetches: Title, Year, imdbRating, Poster
+Fetches: Title, Year, imdbRating, Poster, imdbID
 Includes error handling via exceptions.
+
+Clients:
+- OmdbClient: sync, pooled requests.Session with keep-alive
+- AsyncOmdbClient: asyncio, pooled aiohttp.ClientSession (aiohttp is optional)
+Both parse responses with parse_movie() and look films up by title
+(fetch) or IMDb id (fetch_by_id). fetch_movie_from_omdb() and
+fetch_movie_by_id() use a shared OmdbClient, so repeated lookups reuse the
+same connections.
+
+Resilience: every request goes through a token-bucket rate limiter, is
+retried with exponential backoff and jitter on 429/5xx/timeouts, and is
+refused with CircuitOpenError while the circuit breaker is open (see
+rate_limit.py). By default all clients share one limiter and one breaker;
+pass your own, plus base_url, to test against a local stub server. Each
+client counts the HTTP requests it sent (retries included) in
+`requests_sent`.
+
+Caching: a client given a ResponseCache (storage.omdb_cache) answers repeated
+titles from disk, including "not found" answers. The shared client and the
+batch helpers use the shared cache; OmdbClient() on its own does not cache.
+
+Batch lookups:
+- fetch_movies(titles, concurrency=8) -> iterator of FetchResult (thread pool)
+- fetch_movies_async(titles, concurrency=8) -> async iterator of FetchResult
+Results are yielded as they complete, not in input order.
 """
 
 from __future__ import annotations
 
-from typing import TypedDict
+import asyncio
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import (
+  Any, AsyncIterator, Dict, Iterable, Iterator, Literal, Mapping, Optional, TypedDict,
+)
 
 import requests
+from requests.adapters import HTTPAdapter
+
+from rate_limit import Backoff, CircuitBreaker, TokenBucket
+from storage.omdb_cache import ResponseCache, get_cache, imdb_key, title_key
+
+try:
+  import aiohttp
+except ImportError:  # optional dependency, only needed for AsyncOmdbClient
+  aiohttp = None
 
 
 OMDB_API_KEY = "fcf6b17a"
+OMDB_URL = "https://www.omdbapi.com/"
+DEFAULT_TIMEOUT = 10
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONCURRENCY = 8
+DEFAULT_RATE = 10.0       # requests per second, across all clients
+DEFAULT_BURST = 10
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+_CONNECTION_ERROR = "OMDb API nicht erreichbar oder ungültige Antwort."
 
 
 class ApiConnectionError(Exception):
   """Raised when OMDb cannot be reached or request fails."""
 
 
+class CircuitOpenError(ApiConnectionError):
+  """Raised without a request while the circuit breaker is open."""
+
+
 class MovieNotFoundError(Exception):
   """Raised when OMDb returns no result for the requested title."""
 
@@ -29,21 +82,21 @@ class FetchedMovie(TypedDict):
   year: int
   rating: float
   poster: str
+  imdb_id: str    # "" if OMDb sent none
 
 
-def fetch_movie_from_omdb(title: str) -> FetchedMovie:
-  """Fetch movie info from OMDb by title. Raises on errors."""
-  try:
-    response = requests.get(
-      "https://www.omdbapi.com/",
-      params={"apikey": OMDB_API_KEY, "t": title},
-      timeout=10,
-    )
-    response.raise_for_status()
-    data = response.json()
-  except (requests.RequestException, ValueError) as error:
-    raise ApiConnectionError("OMDb API nicht erreichbar oder ungültige Antwort.") from error
+FetchStatus = Literal["ok", "not_found", "connection_error"]
+
+
+class FetchResult(TypedDict):
+  query: str                        # the title as requested
+  status: FetchStatus
+  movie: Optional[FetchedMovie]     # set when status == "ok"
+  error: Optional[Exception]        # MovieNotFoundError / ApiConnectionError otherwise
 
+
+def parse_movie(data: Mapping[str, Any], title: str) -> FetchedMovie:
+  """Turn an OMDb JSON response into a FetchedMovie. Raises MovieNotFoundError."""
   if data.get("Response") != "True":
     raise MovieNotFoundError("Film nicht gefunden (OMDb).")
 
@@ -51,6 +104,7 @@ def fetch_movie_from_omdb(title: str) -> FetchedMovie:
   year_raw = str(data.get("Year", "")).strip()
   rating_raw = str(data.get("imdbRating", "")).strip()
   poster_raw = str(data.get("Poster", "")).strip()
+  imdb_raw = str(data.get("imdbID", "")).strip()
 
   # Year can be like "2010" or "2010–2014" (series) -> take first 4 chars
   try:
@@ -70,4 +124,366 @@ def fetch_movie_from_omdb(title: str) -> FetchedMovie:
   if not fetched_title:
     fetched_title = title
 
-  return {"title": fetched_title, "year": year, "rating": rating, "poster": poster}
+  return {
+    "title": fetched_title,
+    "year": year,
+    "rating": rating,
+    "poster": poster,
+    "imdb_id": "" if imdb_raw == "N/A" else imdb_raw,
+  }
+
+
+DEFAULT_RATE_LIMITER = TokenBucket(DEFAULT_RATE, DEFAULT_BURST)
+DEFAULT_CIRCUIT_BREAKER = CircuitBreaker()
+
+
+def _retry_after(value: Optional[str]) -> Optional[float]:
+  """Seconds from a Retry-After header; HTTP dates are ignored."""
+  try:
+    return max(0.0, float(value)) if value is not None else None
+  except ValueError:
+    return None
+
+
+def _check_circuit(breaker: CircuitBreaker) -> None:
+  if not breaker.allow():
+    raise CircuitOpenError("OMDb API vorübergehend gesperrt, bitte später erneut versuchen.")
+
+
+def _cached(cache: Optional[ResponseCache], key: str) -> Optional[Dict[str, Any]]:
+  return cache.get(key) if cache is not None else None
+
+
+def _title_params(title: str, year: Optional[int]) -> Dict[str, str]:
+  return {"t": title} if year is None else {"t": title, "y": str(year)}
+
+
+def _store(cache: Optional[ResponseCache], key: str, data: Any) -> None:
+  """Cache a response under `key` and, when found, under its IMDb id."""
+  if cache is None or not isinstance(data, dict):
+    return
+  cache.put(key, data)
+  imdb_id = data.get("imdbID")
+  if data.get("Response") == "True" and isinstance(imdb_id, str) and imdb_id:
+    if imdb_key(imdb_id) != key:
+      cache.put(imdb_key(imdb_id), data)
+
+
+class OmdbClient:
+  """Synchronous OMDb client reusing pooled keep-alive connections.
+
+  Safe to share between threads; pool_size bounds the open connections.
+  """
+
+  def __init__(
+    self,
+    api_key: str = OMDB_API_KEY,
+    base_url: str = OMDB_URL,
+    timeout: float = DEFAULT_TIMEOUT,
+    pool_size: int = DEFAULT_POOL_SIZE,
+    cache: Optional[ResponseCache] = None,
+    rate_limiter: Optional[TokenBucket] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    backoff: Optional[Backoff] = None,
+  ) -> None:
+    self.api_key = api_key
+    self.base_url = base_url
+    self.timeout = timeout
+    self.cache = cache
+    self.rate_limiter = rate_limiter or DEFAULT_RATE_LIMITER
+    self.breaker = breaker or DEFAULT_CIRCUIT_BREAKER
+    self.backoff = backoff or Backoff()
+    self.requests_sent = 0
+    self._sent_lock = threading.Lock()
+    self._session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    self._session.mount("https://", adapter)
+    self._session.mount("http://", adapter)
+
+  def fetch(self, title: str, refresh: bool = False, year: Optional[int] = None) -> FetchedMovie:
+    """Fetch movie info by title (and release year, if given). Raises on errors.
+
+    refresh=True skips the cached response (the new one is still stored).
+    """
+    return self._lookup(title_key(title, year), _title_params(title, year), title, refresh)
+
+  def fetch_by_id(self, imdb_id: str, refresh: bool = False) -> FetchedMovie:
+    """Fetch movie info by IMDb id (e.g. "tt1375666"). Raises on errors."""
+    return self._lookup(imdb_key(imdb_id), {"i": imdb_id.strip()}, imdb_id, refresh)
+
+  def _lookup(
+    self, key: str, params: Dict[str, str], title: str, refresh: bool,
+  ) -> FetchedMovie:
+    data = None if refresh else _cached(self.cache, key)
+    if data is None:
+      data = self._get_json({"apikey": self.api_key, **params})
+      _store(self.cache, key, data)
+    return parse_movie(data, title)
+
+  def _get_json(self, params: Dict[str, str]) -> Any:
+    """GET through the rate limiter, retrying transient failures."""
+    _check_circuit(self.breaker)
+    failure: Optional[Exception] = None
+    retry_after: Optional[float] = None
+    for attempt in range(self.backoff.retries + 1):
+      if attempt:
+        if self.breaker.state == "open":   # opened by another caller meanwhile
+          break
+        time.sleep(self.backoff.delay(attempt - 1, retry_after))
+      self.rate_limiter.acquire()
+      retry_after = None
+      with self._sent_lock:
+        self.requests_sent += 1
+      try:
+        response = self._session.get(self.base_url, params=params, timeout=self.timeout)
+      except (requests.Timeout, requests.ConnectionError) as error:
+        failure = error
+        continue
+      except requests.RequestException as error:
+        self.breaker.record_failure()
+        raise ApiConnectionError(_CONNECTION_ERROR) from error
+
+      if response.status_code in RETRY_STATUSES:
+        failure = requests.HTTPError(f"HTTP {response.status_code}", response=response)
+        retry_after = _retry_after(response.headers.get("Retry-After"))
+        continue
+      try:
+        response.raise_for_status()
+        data = response.json()
+      except (requests.RequestException, ValueError) as error:
+        self.breaker.record_failure()
+        raise ApiConnectionError(_CONNECTION_ERROR) from error
+      self.breaker.record_success()
+      return data
+
+    self.breaker.record_failure()
+    raise ApiConnectionError(_CONNECTION_ERROR) from failure
+
+  def close(self) -> None:
+    self._session.close()
+
+  def __enter__(self) -> OmdbClient:
+    return self
+
+  def __exit__(self, *exc_info: object) -> None:
+    self.close()
+
+
+class AsyncOmdbClient:
+  """asyncio OMDb client on one pooled aiohttp session.
+
+  Create and use it inside a running event loop, preferably as
+  `async with AsyncOmdbClient() as client: ...`. Cache lookups are local
+  SQLite calls and run on the loop directly.
+  """
+
+  def __init__(
+    self,
+    api_key: str = OMDB_API_KEY,
+    base_url: str = OMDB_URL,
+    timeout: float = DEFAULT_TIMEOUT,
+    pool_size: int = DEFAULT_POOL_SIZE,
+    cache: Optional[ResponseCache] = None,
+    rate_limiter: Optional[TokenBucket] = None,
+    breaker: Optional[CircuitBreaker] = None,
+    backoff: Optional[Backoff] = None,
+  ) -> None:
+    if aiohttp is None:
+      raise ImportError("aiohttp is not available.")
+    self.api_key = api_key
+    self.base_url = base_url
+    self.cache = cache
+    self.rate_limiter = rate_limiter or DEFAULT_RATE_LIMITER
+    self.breaker = breaker or DEFAULT_CIRCUIT_BREAKER
+    self.backoff = backoff or Backoff()
+    self.requests_sent = 0
+    self._timeout = aiohttp.ClientTimeout(total=timeout)
+    self._pool_size = pool_size
+    self._session: Optional[Any] = None
+
+  def _get_session(self) -> Any:
+    if self._session is None:
+      connector = aiohttp.TCPConnector(limit=self._pool_size, keepalive_timeout=30)
+      self._session = aiohttp.ClientSession(connector=connector, timeout=self._timeout)
+    return self._session
+
+  async def fetch(
+    self, title: str, refresh: bool = False, year: Optional[int] = None,
+  ) -> FetchedMovie:
+    """Fetch movie info by title (and release year, if given). Raises on errors.
+
+    refresh=True skips the cached response (the new one is still stored).
+    """
+    return await self._lookup(title_key(title, year), _title_params(title, year), title, refresh)
+
+  async def fetch_by_id(self, imdb_id: str, refresh: bool = False) -> FetchedMovie:
+    """Fetch movie info by IMDb id (e.g. "tt1375666"). Raises on errors."""
+    return await self._lookup(imdb_key(imdb_id), {"i": imdb_id.strip()}, imdb_id, refresh)
+
+  async def _lookup(
+    self, key: str, params: Dict[str, str], title: str, refresh: bool,
+  ) -> FetchedMovie:
+    data = None if refresh else _cached(self.cache, key)
+    if data is None:
+      data = await self._get_json({"apikey": self.api_key, **params})
+      _store(self.cache, key, data)
+    return parse_movie(data, title)
+
+  async def _get_json(self, params: Dict[str, str]) -> Any:
+    """GET through the rate limiter, retrying transient failures."""
+    _check_circuit(self.breaker)
+    failure: Optional[Exception] = None
+    retry_after: Optional[float] = None
+    for attempt in range(self.backoff.retries + 1):
+      if attempt:
+        if self.breaker.state == "open":
+          break
+        await asyncio.sleep(self.backoff.delay(attempt - 1, retry_after))
+      await self.rate_limiter.acquire_async()
+      retry_after = None
+      self.requests_sent += 1
+      try:
+        async with self._get_session().get(self.base_url, params=params) as response:
+          if response.status in RETRY_STATUSES:
+            failure = aiohttp.ClientResponseError(
+              response.request_info, response.history, status=response.status,
+            )
+            retry_after = _retry_after(response.headers.get("Retry-After"))
+            continue
+          response.raise_for_status()
+          data = await response.json(content_type=None)
+      except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as error:
+        failure = error
+        continue
+      except (aiohttp.ClientError, ValueError) as error:
+        self.breaker.record_failure()
+        raise ApiConnectionError(_CONNECTION_ERROR) from error
+      self.breaker.record_success()
+      return data
+
+    self.breaker.record_failure()
+    raise ApiConnectionError(_CONNECTION_ERROR) from failure
+
+  async def close(self) -> None:
+    if self._session is not None:
+      await self._session.close()
+      self._session = None
+
+  async def __aenter__(self) -> AsyncOmdbClient:
+    return self
+
+  async def __aexit__(self, *exc_info: object) -> None:
+    await self.close()
+
+
+_default_client: Optional[OmdbClient] = None
+_default_client_lock = threading.Lock()
+
+
+def get_client() -> OmdbClient:
+  """Return the shared OmdbClient, creating it on first use."""
+  global _default_client  # pylint: disable=global-statement
+  if _default_client is None:
+    with _default_client_lock:
+      if _default_client is None:
+        _default_client = OmdbClient(cache=get_cache())
+  return _default_client
+
+
+def fetch_movie_from_omdb(title: str) -> FetchedMovie:
+  """Fetch movie info from OMDb by title. Raises on errors."""
+  return get_client().fetch(title)
+
+
+def fetch_movie_by_id(imdb_id: str) -> FetchedMovie:
+  """Fetch movie info from OMDb by IMDb id. Raises on errors."""
+  return get_client().fetch_by_id(imdb_id)
+
+
+def _result(query: str, movie: Optional[FetchedMovie], error: Optional[Exception]) -> FetchResult:
+  if isinstance(error, MovieNotFoundError):
+    return {"query": query, "status": "not_found", "movie": None, "error": error}
+  if error is not None:
+    return {"query": query, "status": "connection_error", "movie": None, "error": error}
+  return {"query": query, "status": "ok", "movie": movie, "error": None}
+
+
+def _fetch_one(client: OmdbClient, title: str) -> FetchResult:
+  try:
+    return _result(title, client.fetch(title), None)
+  except (MovieNotFoundError, ApiConnectionError) as error:
+    return _result(title, None, error)
+
+
+def fetch_movies(
+  titles: Iterable[str],
+  concurrency: int = DEFAULT_CONCURRENCY,
+  client: Optional[OmdbClient] = None,
+) -> Iterator[FetchResult]:
+  """Look up many titles on a bounded thread pool, yielding results as they finish.
+
+  At most `concurrency` requests run at once and only twice that many titles
+  are pulled from `titles` ahead, so the input may be a long generator.
+  """
+  if concurrency < 1:
+    raise ValueError("concurrency muss mindestens 1 sein.")
+  own_client = client is None
+  active_client = client or OmdbClient(pool_size=concurrency, cache=get_cache())
+  pending: Dict[Future[FetchResult], str] = {}
+  iterator = iter(titles)
+
+  try:
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+      for title in iterator:
+        pending[executor.submit(_fetch_one, active_client, title)] = title
+        if len(pending) >= 2 * concurrency:
+          done, _ = wait(pending, return_when=FIRST_COMPLETED)
+          for future in done:
+            del pending[future]
+            yield future.result()
+      while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+          del pending[future]
+          yield future.result()
+  finally:
+    for future in pending:
+      future.cancel()
+    if own_client:
+      active_client.close()
+
+
+async def fetch_movies_async(
+  titles: Iterable[str],
+  concurrency: int = DEFAULT_CONCURRENCY,
+  client: Optional[AsyncOmdbClient] = None,
+) -> AsyncIterator[FetchResult]:
+  """asyncio version of fetch_movies(): at most `concurrency` requests in flight."""
+  if concurrency < 1:
+    raise ValueError("concurrency muss mindestens 1 sein.")
+  own_client = client is None
+  active_client = client or AsyncOmdbClient(pool_size=concurrency, cache=get_cache())
+
+  async def fetch_one(title: str) -> FetchResult:
+    try:
+      return _result(title, await active_client.fetch(title), None)
+    except (MovieNotFoundError, ApiConnectionError) as error:
+      return _result(title, None, error)
+
+  pending: set[asyncio.Task[FetchResult]] = set()
+  try:
+    for title in titles:
+      pending.add(asyncio.ensure_future(fetch_one(title)))
+      if len(pending) >= concurrency:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+          yield task.result()
+    while pending:
+      done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+      for task in done:
+        yield task.result()
+  finally:
+    for task in pending:
+      task.cancel()
+    if own_client:
+      await active_client.close()
@@ -0,0 +1,141 @@
+"""
+rate_limit.py - Client-side throttling for outgoing API calls.
+
+- TokenBucket: `rate` requests per second with bursts up to `capacity`;
+  thread-safe, usable from sync code (acquire) and asyncio (acquire_async)
+- Backoff: exponential backoff with full jitter, honouring Retry-After
+- CircuitBreaker: fails fast after `failure_threshold` consecutive failures,
+  lets one trial call through after `reset_timeout` seconds
+
+All of them take a `clock` (and Backoff an `rng`), so tests can drive time.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+import time
+from typing import Callable, Literal, Optional
+
+Clock = Callable[[], float]
+CircuitState = Literal["closed", "open", "half_open"]
+
+
+class TokenBucket:
+  """Token bucket; reserve() books a token and says how long to wait for it."""
+
+  def __init__(self, rate: float, capacity: float = 1.0, clock: Clock = time.monotonic) -> None:
+    if rate <= 0 or capacity < 1:
+      raise ValueError("rate muss > 0 und capacity mindestens 1 sein.")
+    self.rate = rate
+    self.capacity = capacity
+    self._clock = clock
+    self._tokens = capacity
+    self._updated = clock()
+    self._lock = threading.Lock()
+
+  def reserve(self, tokens: float = 1.0) -> float:
+    """Take `tokens` now (the balance may go negative); return seconds to wait."""
+    with self._lock:
+      now = self._clock()
+      self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+      self._updated = now
+      self._tokens -= tokens
+      return max(0.0, -self._tokens / self.rate)
+
+  def acquire(self, tokens: float = 1.0) -> None:
+    delay = self.reserve(tokens)
+    if delay > 0:
+      time.sleep(delay)
+
+  async def acquire_async(self, tokens: float = 1.0) -> None:
+    delay = self.reserve(tokens)
+    if delay > 0:
+      await asyncio.sleep(delay)
+
+
+class Backoff:
+  """Retry delays: uniform in [0, min(max_delay, base * factor**attempt)]."""
+
+  def __init__(
+    self,
+    retries: int = 4,
+    base: float = 0.5,
+    factor: float = 2.0,
+    max_delay: float = 30.0,
+    rng: Optional[random.Random] = None,
+  ) -> None:
+    self.retries = retries
+    self.base = base
+    self.factor = factor
+    self.max_delay = max_delay
+    self._rng = rng or random.Random()
+
+  def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+    """Delay before retry number `attempt` (0-based).
+
+    A server-sent Retry-After is used as the lower bound, capped at max_delay.
+    """
+    ceiling = min(self.max_delay, self.base * self.factor ** attempt)
+    delay = self._rng.uniform(0, ceiling)
+    if retry_after is not None:
+      delay = max(delay, min(retry_after, self.max_delay))
+    return delay
+
+
+class CircuitBreaker:
+  """Closed -> open after N consecutive failures -> half-open after a timeout."""
+
+  def __init__(
+    self,
+    failure_threshold: int = 5,
+    reset_timeout: float = 30.0,
+    clock: Clock = time.monotonic,
+  ) -> None:
+    self.failure_threshold = failure_threshold
+    self.reset_timeout = reset_timeout
+    self._clock = clock
+    self._failures = 0
+    self._opened_at: Optional[float] = None
+    self._trial_running = False
+    self._lock = threading.Lock()
+
+  @property
+  def state(self) -> CircuitState:
+    with self._lock:
+      return self._state()
+
+  def _state(self) -> CircuitState:
+    if self._opened_at is None:
+      return "closed"
+    if self._clock() - self._opened_at >= self.reset_timeout:
+      return "half_open"
+    return "open"
+
+  def allow(self) -> bool:
+    """May a call go out now? In half-open state only one trial call may."""
+    with self._lock:
+      state = self._state()
+      if state == "closed":
+        return True
+      if state == "half_open" and not self._trial_running:
+        self._trial_running = True
+        return True
+      return False
+
+  def record_success(self) -> None:
+    with self._lock:
+      self._failures = 0
+      self._opened_at = None
+      self._trial_running = False
+
+  def record_failure(self) -> None:
+    with self._lock:
+      self._failures += 1
+      if self._trial_running or self._failures >= self.failure_threshold:
+        self._opened_at = self._clock()
+      self._trial_running = False
+
+  def reset(self) -> None:
+    self.record_success()
@@ -0,0 +1,144 @@
+"""
+site_builder.py - Build the websites of all users at once.
+
+The parent process reads every user's movies with one grouped query
+(storage.iter_movies_grouped) and hands them in chunks to a process pool,
+where website_generator renders and writes the pages. Users whose page is
+current for their storage revision (in this database) are skipped before
+any rows are read.
+Finally an index page links every user's site.
+
+Public API:
+- page_filename(user_name) / page_title(user_name)
+- build_sites(jobs=None, force=False, progress=None) -> BuildReport
+"""
+
+from __future__ import annotations
+
+import os
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypedDict
+
+import website_generator
+from storage import movie_storage_sql as movie_storage
+from storage.movie_storage_sql import MovieRecord
+
+# Rows per task sent to a worker: large enough to amortise pickling and
+# scheduling, small enough to keep all workers busy.
+TASK_ROWS = 20_000
+
+# Characters escaped in page file names: path separators and the escape itself.
+_UNSAFE_CHARS = frozenset("%/\\\0")
+
+# (filename, app title, revision, movies in display order)
+PageJob = Tuple[str, str, website_generator.PageRevision, List[Tuple[str, MovieRecord]]]
+
+
+class BuildReport(TypedDict):
+  users: int
+  written: int
+  unchanged: int
+
+
+def page_filename(user_name: str) -> str:
+  """Return "<user_name>.html", unique per name and never a reserved file.
+
+  %, path separators and NUL are percent-encoded; a name that would give
+  one of website_generator.RESERVED_FILENAMES (e.g. a user "users") gets a
+  leading "%", which escaping never produces.
+  """
+  stem = "".join(f"%{ord(char):02X}" if char in _UNSAFE_CHARS else char for char in user_name)
+  filename = f"{stem}.html"
+  if filename.casefold() in website_generator.RESERVED_FILENAMES:
+    return f"%{filename}"
+  return filename
+
+
+def page_title(user_name: str) -> str:
+  return f"{user_name}'s Movie App"
+
+
+def _render_pages(jobs: List[PageJob], force: bool) -> Tuple[int, int]:
+  """Worker: render a chunk of pages; returns (pages handled, pages written)."""
+  written = 0
+  for filename, app_title, revision, movies in jobs:
+    written += website_generator.generate_website(
+      movies, app_title, filename, revision=revision, force=force,
+    )
+  return len(jobs), written
+
+
+def build_sites(
+  jobs: Optional[int] = None,
+  force: bool = False,
+  progress: Optional[Callable[[int, int], None]] = None,
+) -> BuildReport:
+  """Generate every user's page on `jobs` processes (default: CPU count).
+
+  `progress(done, total)` is called whenever a chunk of pages is finished.
+  Raises FileNotFoundError if the template is missing and ValueError if
+  jobs < 1.
+  """
+  if jobs is not None and jobs < 1:
+    raise ValueError("jobs muss mindestens 1 sein.")
+  workers = jobs if jobs is not None else os.cpu_count() or 1
+
+  users = movie_storage.list_users()
+  database_id = movie_storage.database_id()
+  revisions = movie_storage.user_revisions()
+
+  def revision(user_id: int) -> website_generator.PageRevision:
+    return website_generator.PageRevision(database_id, user_id, revisions.get(user_id, 0))
+
+  names: Dict[int, str] = {}
+  for user_id, name in users:
+    if force or not website_generator.page_is_current(
+      page_title(name), page_filename(name), revision(user_id),
+    ):
+      names[user_id] = name
+
+  total = len(names)
+  done = 0
+  written = 0
+
+  def chunks() -> Iterator[List[PageJob]]:
+    chunk: List[PageJob] = []
+    rows = 0
+    for user_id, movies in movie_storage.iter_movies_grouped(names):
+      name = names[user_id]
+      chunk.append((page_filename(name), page_title(name), revision(user_id), movies))
+      rows += len(movies) + 1
+      if rows >= TASK_ROWS:
+        yield chunk
+        chunk, rows = [], 0
+    if chunk:
+      yield chunk
+
+  def finished(result: Tuple[int, int]) -> None:
+    nonlocal done, written
+    done += result[0]
+    written += result[1]
+    if progress is not None:
+      progress(done, total)
+
+  if workers == 1:
+    for chunk in chunks():
+      finished(_render_pages(chunk, force))
+  else:
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+      pending: set[Future[Tuple[int, int]]] = set()
+      for chunk in chunks():
+        pending.add(executor.submit(_render_pages, chunk, force))
+        if len(pending) >= 2 * workers:
+          completed, pending = wait(pending, return_when=FIRST_COMPLETED)
+          for future in completed:
+            finished(future.result())
+      for future in wait(pending).done:
+        finished(future.result())
+
+  counts = {user_id: 0 for user_id, _ in users}
+  counts.update(movie_storage.movie_counts())
+  website_generator.generate_index(
+    (name, page_filename(name), counts[user_id]) for user_id, name in users
+  )
+  return {"users": len(users), "written": written, "unchanged": len(users) - written}
@@ -0,0 +1,115 @@
+"""
+storage/analytics.py - Vectorised rating analytics (optional, needs NumPy).
+
+Loads ratings and years straight from SQLite into NumPy arrays and
+computes everything in bulk: mean, median, percentiles, standard deviation,
+histogram and a per-decade breakdown. main.stats() shows the extra figures
+when NumPy is installed.
+
+Public API:
+- HAS_NUMPY
+- load_columns(user_id) -> (ratings, years)
+- summarize(ratings, years=None) -> dict
+- analyze_user(user_id) -> dict | None
+
+Everything except HAS_NUMPY raises ImportError when NumPy is missing;
+callers check HAS_NUMPY and keep a pure-Python fallback.
+"""
+
+from __future__ import annotations
+
+from itertools import chain
+from typing import Any, Dict, List, Optional, Sequence, Tuple, TypedDict
+
+from storage import movie_storage_sql as movie_storage
+from storage.movie_storage_sql import HISTOGRAM_BUCKETS
+
+try:
+  import numpy as np
+except ImportError:  # optional dependency
+  np = None
+
+HAS_NUMPY = np is not None
+
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90)
+
+
+class DecadeStats(TypedDict):
+  count: int
+  mean: float
+
+
+class RatingSummary(TypedDict):
+  count: int
+  mean: float
+  median: float
+  std: float
+  min: float
+  max: float
+  percentiles: Dict[int, float]
+  histogram: List[int]
+  decades: Dict[int, DecadeStats]
+
+
+def _require_numpy() -> None:
+  if np is None:
+    raise ImportError("numpy is not available.")
+
+
+def load_columns(user_id: int) -> Tuple[Any, Any]:
+  """Return (ratings float64, years int64) arrays for a user, in one pass."""
+  _require_numpy()
+  flat = np.fromiter(
+    chain.from_iterable(movie_storage.iter_rating_rows(user_id)),
+    dtype=np.float64,
+  )
+  columns = flat.reshape(-1, 2)
+  return columns[:, 0].copy(), columns[:, 1].astype(np.int64)
+
+
+def summarize(
+  ratings: Any,
+  years: Optional[Any] = None,
+  percentiles: Sequence[int] = DEFAULT_PERCENTILES,
+) -> RatingSummary:
+  """Compute summary statistics of a non-empty rating array.
+
+  The histogram uses the storage buckets [0, 1), [1, 2), ... [9, 10].
+  """
+  _require_numpy()
+  if ratings.size == 0:
+    raise ValueError("ratings must not be empty")
+
+  buckets = np.clip(np.floor(ratings), 0, HISTOGRAM_BUCKETS - 1).astype(np.int64)
+  histogram = np.bincount(buckets, minlength=HISTOGRAM_BUCKETS)
+
+  decades: Dict[int, DecadeStats] = {}
+  if years is not None:
+    decade_keys, inverse = np.unique(years // 10 * 10, return_inverse=True)
+    counts = np.bincount(inverse)
+    sums = np.bincount(inverse, weights=ratings)
+    decades = {
+      int(decade): {"count": int(count), "mean": float(total / count)}
+      for decade, count, total in zip(decade_keys, counts, sums)
+    }
+
+  values = np.percentile(ratings, list(percentiles)) if percentiles else []
+  return {
+    "count": int(ratings.size),
+    "mean": float(ratings.mean()),
+    "median": float(np.median(ratings)),
+    "std": float(ratings.std()),
+    "min": float(ratings.min()),
+    "max": float(ratings.max()),
+    "percentiles": {int(p): float(v) for p, v in zip(percentiles, values)},
+    "histogram": [int(count) for count in histogram],
+    "decades": decades,
+  }
+
+
+def analyze_user(user_id: int) -> Optional[RatingSummary]:
+  """Load a user's ratings and years from SQLite and summarize them."""
+  ratings, years = load_columns(user_id)
+  if ratings.size == 0:
+    return None
+  return summarize(ratings, years)
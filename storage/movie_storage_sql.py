@@ -4,24 +4,100 @@ storage/movie_storage_sql.py - SQLite storage using SQLAlchemy (raw SQL via text
 User profiles:
 - users table
 - movies linked to users via user_id (FK)
+- catalog: one row per film (keyed by IMDb id when known) holding poster and
+  OMDb rating; movies link to it via catalog_id and keep a personal_rating
 
 Public API:
 - list_users() -> list[tuple[int, str]]
 - create_user(name) -> int
 - get_user_id(name) -> int | None
 
-- get_movies(user_id) -> dict
-- add_movie(user_id, title, year, rating, poster)
+- get_movies(user_id) -> MovieTable (compact read-only mapping, cached per user)
+- count_movies(user_id) -> int
+- movie_counts() -> dict[int, int] (all users with movies)
+- iter_movies(user_id, order_by="title", page_size=1000) -> iterator of (title, record)
+- page(user_id, after=None, limit=50, order_by="title") -> dict (movies, next)
+- top_movies(user_id, n=20, order_by="rating") -> list[(title, record)]
+- find_movie(user_id, title, case_insensitive=True) -> (title, record) | None
+- movie_exists(user_id, title, case_insensitive=True) -> bool
+- search_movies(user_id, query, limit=50) -> list[(title, record)]
+- suggest_titles(user_id, query, n=5, cutoff=0.6) -> list[str]
+- rating_stats(user_id) -> dict | None (count, avg, median, min, max, best, worst)
+- rating_histogram(user_id) -> list[int] (HISTOGRAM_BUCKETS counts, bucket i = [i, i+1))
+- iter_rating_rows(user_id) -> iterator of raw (rating, year) tuples (see storage.analytics)
+- random_movie(user_id, k=1, weighted_by=None) -> list[(title, record)]
+
+Summary tables (user_stats, user_rating_buckets) are kept up to date by
+triggers on movies, so stats and histograms do not scan the collection:
+- check_user_stats() -> list[int] (ids of users whose summary is stale)
+- rebuild_user_stats(user_id=None)
+- add_movie(user_id, title, year, rating, poster, imdb_id=None)
+  (years must lie in YEAR_MIN..YEAR_MAX, else ValueError; also in add_movies_bulk)
 - delete_movie(user_id, title)
 - update_movie(user_id, title, rating)
+- add_movies_bulk(user_id, records, batch_size=5000) -> dict
+- get_catalog_movie(imdb_id) -> dict | None
+- user_revision(user_id) -> int (changes whenever the user's movies change)
+- user_revisions() -> dict[int, int] (all users at once)
+- database_id() -> str (random id of this database, set when it is created)
+- iter_movies_grouped(user_ids) -> iterator of (user_id, [(title, record), ...]),
+  each user's movies by rating (desc) like iter_movies(order_by="rating")
+
+Catalog refresh (driven by catalog_refresh.py):
+- open_refresh_run(max_age) -> dict (resumes the unfinished run, if any)
+- refresh_candidates(run, limit=100) -> list[dict] (stalest first, after the checkpoint)
+- save_refresh_batch(run, results, cursor, failed=0) -> int (changed films)
+- finish_refresh_run(run)
+
+Engine:
+- configure(url=None, pragmas=None, pool_size=5)
+- get_engine() -> Engine
+  (created lazily on first use; URL from configure(), $MOVIE_DB_URL or DB_URL)
+- make_engine(url, pragmas=None, pool_size=5) -> Engine
+  (WAL journal, foreign keys and tuned cache/mmap pragmas on every connection)
+- is_memory_url(url) -> bool
+
+Cache:
+- get_movies() snapshots are kept per user in an LRU cache capped at
+  CACHE_MAX_MOVIES movies in total; add/delete/update patch them in place.
+  Each snapshot remembers the user_revision() it was read at and is
+  reloaded once that changes (e.g. by a write in another process).
+- The per-user title indexes behind suggest_titles() are cached the same way
+  (including the revision check), capped at INDEX_CACHE_MAX_BYTES in total.
+- cache_info() -> dict (hits, misses, users, movies, max_movies, index_bytes,
+  max_index_bytes)
+- clear_cache()
+
+Diagnostics:
+- explain_queries() -> dict
+- full_scans() -> dict (plans that scan a whole table, except the allowed ones)
 """
 
 from __future__ import annotations
 
-from typing import Dict, TypedDict, List, Optional, Tuple
+import os
+import random
+import re
+import threading
+import time
+from collections import OrderedDict
+from itertools import islice
+from pathlib import Path
+from typing import (
+  TYPE_CHECKING, Any, Dict, Iterable, Iterator, Mapping, TypedDict, List, Optional, Tuple,
+)
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import bindparam, create_engine, event, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.sql.elements import TextClause
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from storage.movie_table import YEAR_MAX, YEAR_MIN, MovieTable
+
+if TYPE_CHECKING:
+  # Imported in suggest_titles(): title_index pulls in NumPy.
+  from storage.title_index import TitleIndex
 
 
 class MovieRecord(TypedDict):
@@ -30,15 +106,518 @@ class MovieRecord(TypedDict):
   poster: str
 
 
-MovieData = Dict[str, MovieRecord]
+MovieData = Mapping[str, MovieRecord]
+
+
+class BulkInsertResult(TypedDict):
+  inserted: int
+  skipped: int
+  conflicts: List[str]
+
+
+# Keyset cursor: (sort key of the last movie, its id).
+PageCursor = Tuple[Any, int]
+
+
+class MoviePage(TypedDict):
+  movies: List[Tuple[str, MovieRecord]]
+  next: Optional[PageCursor]
+
+
+class RatingStats(TypedDict):
+  count: int
+  avg: float
+  median: float
+  min: float
+  max: float
+  best: List[str]
+  worst: List[str]
+
+
+class CatalogMovie(TypedDict):
+  id: int
+  imdb_id: Optional[str]
+  title: str
+  year: int
+  rating: float
+  poster: str
+  refreshed_at: Optional[float]   # unix time of the last OMDb fetch
+
+
+class RefreshRun(TypedDict):
+  id: int
+  started_at: float
+  cutoff: float                 # entries refreshed before this are stale
+  cursor: PageCursor            # (COALESCE(refreshed_at, 0), id) of the last entry done
+  processed: int
+  updated: int
+  failed: int
+
+
+class CatalogRefresh(TypedDict):
+  id: int                       # catalog id
+  imdb_id: str                  # as returned by OMDb ("" if unknown)
+  rating: Optional[float]       # None: OMDb found nothing, only mark as checked
+  poster: str
+
+
+class CacheInfo(TypedDict):
+  hits: int
+  misses: int
+  users: int
+  movies: int
+  max_movies: int
+  index_bytes: int
+  max_index_bytes: int
+
 
 DB_URL = "sqlite:///data/movies.db"
-engine = create_engine(DB_URL, echo=False, future=True)
+DB_URL_ENV = "MOVIE_DB_URL"
+
+# Applied to every new DBAPI connection, in this order.
+DEFAULT_PRAGMAS: Dict[str, Any] = {
+  "journal_mode": "WAL",          # readers no longer block on the writer
+  "synchronous": "NORMAL",        # safe with WAL, fsync only at checkpoints
+  "foreign_keys": "ON",           # makes ON DELETE CASCADE work
+  "busy_timeout": 5000,           # ms to wait for a lock instead of failing
+  "cache_size": -64000,           # negative = KiB, i.e. ~64 MB page cache
+  "mmap_size": 256 * 1024 * 1024,
+}
+
+
+def is_memory_url(url: str) -> bool:
+  """True for SQLite URLs of an in-memory database (one shared connection)."""
+  return url in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in url
+
+
+def make_engine(
+  url: str = DB_URL,
+  pragmas: Optional[Mapping[str, Any]] = None,
+  pool_size: int = 5,
+) -> Engine:
+  """Create a SQLite engine with tuned pragmas and a pool for concurrent readers.
+
+  `pragmas` overrides or extends DEFAULT_PRAGMAS. File databases get a
+  QueuePool so report jobs can read on their own connections while an import
+  writes; in-memory databases share one connection (StaticPool), since every
+  new connection would otherwise see an empty database.
+  """
+  settings = {**DEFAULT_PRAGMAS, **(pragmas or {})}
+
+  if is_memory_url(url):
+    new_engine = create_engine(
+      url,
+      echo=False,
+      future=True,
+      poolclass=StaticPool,
+      connect_args={"check_same_thread": False},
+    )
+  else:
+    database = make_url(url).database
+    if database:
+      Path(database).parent.mkdir(parents=True, exist_ok=True)
+    new_engine = create_engine(
+      url,
+      echo=False,
+      future=True,
+      poolclass=QueuePool,
+      pool_size=pool_size,
+      max_overflow=pool_size,
+      connect_args={"check_same_thread": False},
+    )
+
+  @event.listens_for(new_engine, "connect")
+  def _apply_pragmas(dbapi_connection: Any, _connection_record: Any) -> None:
+    # pysqlite would only BEGIN before the first DML and commit DDL on its
+    # own; let SQLAlchemy's "begin" below open every transaction instead.
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    try:
+      for name, value in settings.items():
+        cursor.execute(f"PRAGMA {name} = {value}")
+    finally:
+      cursor.close()
+
+  # execution_options(sqlite_begin="IMMEDIATE") takes the write lock up
+  # front, so reads made before the first write cannot go stale.
+  @event.listens_for(new_engine, "begin")
+  def _begin(connection: Any) -> None:
+    mode = connection.get_execution_options().get("sqlite_begin", "")
+    connection.exec_driver_sql(f"BEGIN {mode}".strip())
+
+  return new_engine
+
+
+_engine: Optional[Engine] = None
+_engine_lock = threading.Lock()
+_engine_options: Dict[str, Any] = {}
+
+
+# Oldest SQLite the schema works with (ALTER TABLE ... DROP COLUMN in
+# migration 5; UPDATE ... FROM and window functions are older).
+MIN_SQLITE_VERSION = (3, 35, 0)
+
+HISTOGRAM_BUCKETS = 10
+
+
+def _bucket_sql(column: str) -> str:
+  """SQL expression mapping a rating to its histogram bucket (0..9)."""
+  return f"MIN(MAX(CAST({column} AS INTEGER), 0), {HISTOGRAM_BUCKETS - 1})"
+
+
+# Schema migrations, applied in order on top of the base tables.
+# PRAGMA user_version stores how many of them already ran.
+_MIGRATIONS: List[Tuple[str, ...]] = [
+  # 1: secondary indexes for rating/year reports and case-insensitive lookups
+  (
+    "CREATE INDEX IF NOT EXISTS idx_movies_user_rating ON movies (user_id, rating DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_movies_user_year ON movies (user_id, year)",
+    "CREATE INDEX IF NOT EXISTS idx_movies_user_title_nocase"
+    " ON movies (user_id, title COLLATE NOCASE)",
+  ),
+  # 2: FTS5 title index kept in sync with movies by triggers. user_id is
+  # indexed as a token so a search only walks the doclist of one user.
+  (
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS movies_fts USING fts5(
+      title, user_id,
+      content='movies', content_rowid='id',
+      tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movies_fts_insert AFTER INSERT ON movies BEGIN
+      INSERT INTO movies_fts (rowid, title, user_id) VALUES (new.id, new.title, new.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movies_fts_delete AFTER DELETE ON movies BEGIN
+      INSERT INTO movies_fts (movies_fts, rowid, title, user_id)
+      VALUES ('delete', old.id, old.title, old.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movies_fts_update AFTER UPDATE OF title, user_id ON movies BEGIN
+      INSERT INTO movies_fts (movies_fts, rowid, title, user_id)
+      VALUES ('delete', old.id, old.title, old.user_id);
+      INSERT INTO movies_fts (rowid, title, user_id) VALUES (new.id, new.title, new.user_id);
+    END
+    """,
+    "INSERT INTO movies_fts (movies_fts) VALUES ('rebuild')",
+  ),
+  # 3: per-user rating summary and histogram, maintained by triggers.
+  # min/max are re-read from the rating index only when the old extreme goes.
+  (
+    """
+    CREATE TABLE IF NOT EXISTS user_stats (
+      user_id INTEGER PRIMARY KEY,
+      movie_count INTEGER NOT NULL,
+      rating_sum REAL NOT NULL,
+      min_rating REAL,
+      max_rating REAL,
+      FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS user_rating_buckets (
+      user_id INTEGER NOT NULL,
+      bucket INTEGER NOT NULL,
+      movie_count INTEGER NOT NULL,
+      PRIMARY KEY (user_id, bucket),
+      FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+    ) WITHOUT ROWID
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS user_stats_insert AFTER INSERT ON movies BEGIN
+      INSERT INTO user_stats (user_id, movie_count, rating_sum, min_rating, max_rating)
+      VALUES (new.user_id, 1, new.rating, new.rating, new.rating)
+      ON CONFLICT(user_id) DO UPDATE SET
+        movie_count = movie_count + 1,
+        rating_sum = rating_sum + excluded.rating_sum,
+        min_rating = MIN(COALESCE(min_rating, excluded.min_rating), excluded.min_rating),
+        max_rating = MAX(COALESCE(max_rating, excluded.max_rating), excluded.max_rating);
+      INSERT INTO user_rating_buckets (user_id, bucket, movie_count)
+      VALUES (new.user_id, {_bucket_sql("new.rating")}, 1)
+      ON CONFLICT(user_id, bucket) DO UPDATE SET movie_count = movie_count + 1;
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS user_stats_delete AFTER DELETE ON movies BEGIN
+      UPDATE user_stats SET
+        movie_count = movie_count - 1,
+        rating_sum = rating_sum - old.rating,
+        min_rating = CASE WHEN old.rating <= min_rating
+          THEN (SELECT MIN(rating) FROM movies WHERE user_id = old.user_id)
+          ELSE min_rating END,
+        max_rating = CASE WHEN old.rating >= max_rating
+          THEN (SELECT MAX(rating) FROM movies WHERE user_id = old.user_id)
+          ELSE max_rating END
+      WHERE user_id = old.user_id;
+      UPDATE user_rating_buckets SET movie_count = movie_count - 1
+      WHERE user_id = old.user_id AND bucket = {_bucket_sql("old.rating")};
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS user_stats_update AFTER UPDATE OF rating ON movies
+    WHEN old.rating IS NOT new.rating BEGIN
+      UPDATE user_stats SET
+        rating_sum = rating_sum - old.rating + new.rating,
+        min_rating = (SELECT MIN(rating) FROM movies WHERE user_id = new.user_id),
+        max_rating = (SELECT MAX(rating) FROM movies WHERE user_id = new.user_id)
+      WHERE user_id = new.user_id;
+      UPDATE user_rating_buckets SET movie_count = movie_count - 1
+      WHERE user_id = old.user_id AND bucket = {_bucket_sql("old.rating")};
+      INSERT INTO user_rating_buckets (user_id, bucket, movie_count)
+      VALUES (new.user_id, {_bucket_sql("new.rating")}, 1)
+      ON CONFLICT(user_id, bucket) DO UPDATE SET movie_count = movie_count + 1;
+    END
+    """,
+    """
+    INSERT INTO user_stats (user_id, movie_count, rating_sum, min_rating, max_rating)
+    SELECT user_id, COUNT(*), SUM(rating), MIN(rating), MAX(rating)
+    FROM movies GROUP BY user_id
+    """,
+    f"""
+    INSERT INTO user_rating_buckets (user_id, bucket, movie_count)
+    SELECT user_id, {_bucket_sql("rating")}, COUNT(*)
+    FROM movies GROUP BY user_id, 2
+    """,
+  ),
+  # 4: dense per-user slot numbers 0..n-1 for O(1) random picks. A deleted
+  # movie's slot is taken over by the movie holding the highest slot.
+  (
+    "ALTER TABLE movies ADD COLUMN slot INTEGER",
+    """
+    UPDATE movies SET slot = ranked.slot
+    FROM (
+      SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY id) - 1 AS slot
+      FROM movies
+    ) AS ranked
+    WHERE ranked.id = movies.id
+    """,
+    "CREATE UNIQUE INDEX IF NOT EXISTS idx_movies_user_slot ON movies (user_id, slot)",
+    """
+    CREATE TRIGGER IF NOT EXISTS movies_slot_insert AFTER INSERT ON movies BEGIN
+      UPDATE movies
+      SET slot = (SELECT COALESCE(MAX(slot), -1) + 1 FROM movies WHERE user_id = new.user_id)
+      WHERE id = new.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS movies_slot_delete AFTER DELETE ON movies BEGIN
+      UPDATE movies SET slot = old.slot
+      WHERE user_id = old.user_id
+        AND slot > old.slot
+        AND slot = (SELECT MAX(slot) FROM movies WHERE user_id = old.user_id);
+    END
+    """,
+  ),
+  # 5: shared film catalog keyed by IMDb id. Poster and OMDb rating live
+  # there once per film; movies keeps title/year/rating as per-user sort
+  # keys (rating = personal_rating if set, else the catalog rating, synced
+  # by trigger). Existing rows with a poster are merged per (title, year,
+  # poster); rows without one get a private catalog row with the same id.
+  # The old schema cannot tell OMDb ratings from ratings a user changed,
+  # so every existing rating is kept as personal_rating; a catalog refresh
+  # must never overwrite it.
+  (
+    """
+    CREATE TABLE IF NOT EXISTS catalog (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      imdb_id TEXT UNIQUE,
+      title TEXT NOT NULL,
+      year INTEGER NOT NULL,
+      rating REAL NOT NULL,
+      poster TEXT NOT NULL,
+      refreshed_at REAL
+    )
+    """,
+    "ALTER TABLE movies ADD COLUMN catalog_id INTEGER REFERENCES catalog(id)",
+    "ALTER TABLE movies ADD COLUMN personal_rating REAL",
+    """
+    INSERT INTO catalog (id, title, year, rating, poster)
+    SELECT id, title, year, rating, poster FROM movies WHERE poster = ''
+    """,
+    # The most common rating of a film becomes its catalog rating.
+    """
+    INSERT INTO catalog (title, year, rating, poster)
+    SELECT title, year, rating, poster FROM (
+      SELECT title, year, rating, poster, ROW_NUMBER() OVER (
+        PARTITION BY title, year, poster ORDER BY COUNT(*) DESC, MIN(id)
+      ) AS rank
+      FROM movies
+      WHERE poster != ''
+      GROUP BY title, year, poster, rating
+    )
+    WHERE rank = 1
+    """,
+    "CREATE INDEX idx_catalog_migrate ON catalog (poster, title, year)",
+    "UPDATE movies SET catalog_id = id WHERE poster = ''",
+    """
+    UPDATE movies SET catalog_id = c.id
+    FROM catalog AS c
+    WHERE movies.poster != ''
+      AND c.poster = movies.poster AND c.title = movies.title AND c.year = movies.year
+    """,
+    "UPDATE movies SET personal_rating = rating",
+    "DROP INDEX idx_catalog_migrate",
+    "ALTER TABLE movies DROP COLUMN poster",
+    "CREATE INDEX IF NOT EXISTS idx_movies_catalog ON movies (catalog_id)",
+    """
+    CREATE TRIGGER IF NOT EXISTS catalog_rating_update AFTER UPDATE OF rating ON catalog
+    WHEN old.rating IS NOT new.rating BEGIN
+      UPDATE movies SET rating = new.rating
+      WHERE catalog_id = new.id AND personal_rating IS NULL;
+    END
+    """,
+    # Catalog rows without IMDb id are not shared by later adds; drop them
+    # with their last movie.
+    """
+    CREATE TRIGGER IF NOT EXISTS catalog_cleanup AFTER DELETE ON movies BEGIN
+      DELETE FROM catalog
+      WHERE id = old.catalog_id
+        AND imdb_id IS NULL
+        AND NOT EXISTS (SELECT 1 FROM movies WHERE catalog_id = old.catalog_id);
+    END
+    """,
+  ),
+  # 6: catalog refresh: staleness order (never refreshed first) and
+  # resumable run checkpoints.
+  (
+    "CREATE INDEX IF NOT EXISTS idx_catalog_refresh ON catalog (COALESCE(refreshed_at, 0), id)",
+    """
+    CREATE TABLE IF NOT EXISTS catalog_refresh_runs (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      started_at REAL NOT NULL,
+      cutoff REAL NOT NULL,
+      last_key REAL NOT NULL DEFAULT 0,
+      last_id INTEGER NOT NULL DEFAULT 0,
+      processed INTEGER NOT NULL DEFAULT 0,
+      updated INTEGER NOT NULL DEFAULT 0,
+      failed INTEGER NOT NULL DEFAULT 0,
+      finished_at REAL
+    )
+    """,
+  ),
+  # 7: per-user revision counter, bumped by every change that alters what
+  # the user's website shows; lets website_generator skip unchanged users.
+  (
+    """
+    CREATE TABLE IF NOT EXISTS user_revisions (
+      user_id INTEGER PRIMARY KEY,
+      revision INTEGER NOT NULL,
+      FOREIGN KEY(user_id) REFERENCES users(id) ON DELETE CASCADE
+    )
+    """,
+    "INSERT INTO user_revisions (user_id, revision) SELECT id, 1 FROM users",
+    """
+    CREATE TRIGGER IF NOT EXISTS user_revisions_user AFTER INSERT ON users BEGIN
+      INSERT INTO user_revisions (user_id, revision) VALUES (new.id, 1)
+      ON CONFLICT(user_id) DO UPDATE SET revision = revision + 1;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_revisions_insert AFTER INSERT ON movies BEGIN
+      UPDATE user_revisions SET revision = revision + 1 WHERE user_id = new.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_revisions_delete AFTER DELETE ON movies BEGIN
+      UPDATE user_revisions SET revision = revision + 1 WHERE user_id = old.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS user_revisions_update
+    AFTER UPDATE OF title, year, rating, catalog_id ON movies BEGIN
+      UPDATE user_revisions SET revision = revision + 1 WHERE user_id = new.user_id;
+    END
+    """,
+    # Rating changes reach movies through catalog_rating_update; posters
+    # are only stored in the catalog.
+    """
+    CREATE TRIGGER IF NOT EXISTS user_revisions_poster AFTER UPDATE OF poster ON catalog
+    WHEN old.poster IS NOT new.poster BEGIN
+      UPDATE user_revisions SET revision = revision + 1
+      WHERE user_id IN (SELECT user_id FROM movies WHERE catalog_id = new.id);
+    END
+    """,
+  ),
+  # 8: random database id, and random instead of counting revisions, so a
+  # revision seen in one database never matches another one, a reset
+  # database or a restored backup.
+  (
+    """
+    CREATE TABLE IF NOT EXISTS database_info (
+      id INTEGER PRIMARY KEY CHECK (id = 1),
+      database_id TEXT NOT NULL
+    )
+    """,
+    "INSERT INTO database_info (id, database_id) VALUES (1, lower(hex(randomblob(16))))",
+    "UPDATE user_revisions SET revision = random()",
+    "DROP TRIGGER user_revisions_user",
+    "DROP TRIGGER user_revisions_insert",
+    "DROP TRIGGER user_revisions_delete",
+    "DROP TRIGGER user_revisions_update",
+    "DROP TRIGGER user_revisions_poster",
+    """
+    CREATE TRIGGER user_revisions_user AFTER INSERT ON users BEGIN
+      INSERT INTO user_revisions (user_id, revision) VALUES (new.id, random())
+      ON CONFLICT(user_id) DO UPDATE SET revision = random();
+    END
+    """,
+    """
+    CREATE TRIGGER user_revisions_insert AFTER INSERT ON movies BEGIN
+      UPDATE user_revisions SET revision = random() WHERE user_id = new.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER user_revisions_delete AFTER DELETE ON movies BEGIN
+      UPDATE user_revisions SET revision = random() WHERE user_id = old.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER user_revisions_update
+    AFTER UPDATE OF title, year, rating, catalog_id ON movies BEGIN
+      UPDATE user_revisions SET revision = random() WHERE user_id = new.user_id;
+    END
+    """,
+    """
+    CREATE TRIGGER user_revisions_poster AFTER UPDATE OF poster ON catalog
+    WHEN old.poster IS NOT new.poster BEGIN
+      UPDATE user_revisions SET revision = random()
+      WHERE user_id IN (SELECT user_id FROM movies WHERE catalog_id = new.id);
+    END
+    """,
+  ),
+]
+
+# Every statement the module runs, by name, so explain_queries() can audit them.
+_STATEMENTS: Dict[str, Tuple[str, Tuple[str, ...]]] = {}
+_PARAM_PATTERN = re.compile(r"(?<![:\w]):(\w+)")
+_SEARCH_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def _statement(name: str, sql: str, expanding: Tuple[str, ...] = ()) -> TextClause:
+  """Register a SQL statement and return it as a text() clause."""
+  _STATEMENTS[name] = (sql, expanding)
+  clause = text(sql)
+  if expanding:
+    clause = clause.bindparams(*(bindparam(param, expanding=True) for param in expanding))
+  return clause
 
 
-def _init_db() -> None:
-  """Create tables if they do not exist."""
-  with engine.begin() as connection:
+def _init_db(target: Engine) -> None:
+  """Create tables if they do not exist and apply pending migrations.
+
+  Everything runs in one transaction, so a failed migration leaves the
+  database at its previous version.
+  """
+  with target.execution_options(sqlite_begin="IMMEDIATE").begin() as connection:
+    version_text = str(connection.execute(text("SELECT sqlite_version()")).scalar())
+    if tuple(int(part) for part in version_text.split(".")[:3]) < MIN_SQLITE_VERSION:
+      minimum = ".".join(str(part) for part in MIN_SQLITE_VERSION)
+      raise RuntimeError(f"SQLite {minimum} oder neuer benötigt, gefunden: {version_text}")
+
     # Users
     connection.execute(text("""
       CREATE TABLE IF NOT EXISTS users (
@@ -61,27 +640,405 @@ def _init_db() -> None:
       )
     """))
 
+    version = int(connection.execute(text("PRAGMA user_version")).scalar() or 0)
+    for number, statements in enumerate(_MIGRATIONS[version:], start=version + 1):
+      for statement in statements:
+        connection.execute(text(statement))
+      connection.execute(text(f"PRAGMA user_version = {number}"))
+
+
+def configure(
+  url: Optional[str] = None,
+  pragmas: Optional[Mapping[str, Any]] = None,
+  pool_size: int = 5,
+) -> None:
+  """Point the storage at another database, e.g. "sqlite://" for tests.
+
+  The engine itself is still created lazily; an existing one is disposed.
+  """
+  global _engine  # pylint: disable=global-statement
+  with _engine_lock:
+    if _engine is not None:
+      _engine.dispose()
+    _engine = None
+    clear_cache()
+    _engine_options.clear()
+    _engine_options.update({"url": url, "pragmas": pragmas, "pool_size": pool_size})
+
+
+def _write_transaction() -> Any:
+  """engine.begin() for transactions that read before they write."""
+  return get_engine().execution_options(sqlite_begin="IMMEDIATE").begin()
+
+
+def get_engine() -> Engine:
+  """Return the engine, creating it and the schema once on first use."""
+  global _engine  # pylint: disable=global-statement
+  if _engine is None:
+    with _engine_lock:
+      if _engine is None:
+        url = _engine_options.get("url") or os.environ.get(DB_URL_ENV) or DB_URL
+        new_engine = make_engine(
+          url,
+          pragmas=_engine_options.get("pragmas"),
+          pool_size=_engine_options.get("pool_size", 5),
+        )
+        _init_db(new_engine)
+        _engine = new_engine
+  return _engine
+
+
+_LIST_USERS = _statement("list_users", "SELECT id, name FROM users ORDER BY name")
+_CREATE_USER = _statement("create_user", "INSERT INTO users (name) VALUES (:name)")
+_GET_USER_ID = _statement("get_user_id", "SELECT id FROM users WHERE name = :name")
+
+_GET_MOVIES = _statement("get_movies", """
+  SELECT m.title, m.year, m.rating, c.poster
+  FROM movies AS m
+  JOIN catalog AS c ON c.id = m.catalog_id
+  WHERE m.user_id = :user_id
+  ORDER BY m.title
+""")
+_LIST_TITLES = _statement(
+  "list_titles",
+  "SELECT title FROM movies WHERE user_id = :user_id",
+)
+_FIND_MOVIE = _statement("find_movie", """
+  SELECT m.title, m.year, m.rating, c.poster
+  FROM movies AS m
+  JOIN catalog AS c ON c.id = m.catalog_id
+  WHERE m.user_id = :user_id AND m.title = :title
+""")
+# Prefers the exact spelling if several titles differ only in case.
+_FIND_MOVIE_NOCASE = _statement("find_movie_nocase", """
+  SELECT m.title, m.year, m.rating, c.poster
+  FROM movies AS m
+  JOIN catalog AS c ON c.id = m.catalog_id
+  WHERE m.user_id = :user_id AND m.title = :title COLLATE NOCASE
+  ORDER BY m.title = :title DESC
+  LIMIT 1
+""")
+_MOVIE_EXISTS = _statement("movie_exists", """
+  SELECT 1 FROM movies WHERE user_id = :user_id AND title = :title
+""")
+_MOVIE_EXISTS_NOCASE = _statement("movie_exists_nocase", """
+  SELECT 1 FROM movies WHERE user_id = :user_id AND title = :title COLLATE NOCASE LIMIT 1
+""")
+# bm25 weights: rank by title only, user_id is just a filter column.
+_SEARCH_MOVIES = _statement("search_movies", """
+  SELECT m.title, m.year, m.rating, c.poster
+  FROM movies_fts
+  JOIN movies AS m ON m.id = movies_fts.rowid
+  JOIN catalog AS c ON c.id = m.catalog_id
+  WHERE movies_fts MATCH :query AND m.user_id = :user_id
+  ORDER BY bm25(movies_fts, 1.0, 0.0)
+  LIMIT :limit
+""")
+_USER_STATS = _statement("user_stats", """
+  SELECT movie_count, rating_sum, min_rating, max_rating
+  FROM user_stats
+  WHERE user_id = :user_id
+""")
+_RATING_BUCKETS = _statement("rating_buckets", """
+  SELECT bucket, movie_count FROM user_rating_buckets WHERE user_id = :user_id
+""")
+# The rating at position :offset (and the one after it) among ratings >= :low;
+# the histogram tells in which bucket the median sits, so :offset stays small.
+_RATINGS_FROM = _statement("ratings_from", """
+  SELECT rating FROM movies
+  WHERE user_id = :user_id AND rating >= :low
+  ORDER BY rating
+  LIMIT 2 OFFSET :offset
+""")
+_TITLES_WITH_RATING = _statement("titles_with_rating", """
+  SELECT title FROM movies WHERE user_id = :user_id AND rating = :rating
+""")
+_MOVIES_AT_SLOTS = _statement("movies_at_slots", """
+  SELECT m.slot, m.title, m.year, m.rating, c.poster
+  FROM movies AS m
+  JOIN catalog AS c ON c.id = m.catalog_id
+  WHERE m.user_id = :user_id AND m.slot IN :slots
+""", expanding=("slots",))
+_DATABASE_ID = _statement(
+  "database_id",
+  "SELECT database_id FROM database_info WHERE id = 1",
+)
+_USER_REVISION = _statement(
+  "user_revision",
+  "SELECT revision FROM user_revisions WHERE user_id = :user_id",
+)
+_ALL_USER_REVISIONS = _statement(
+  "all_user_revisions",
+  "SELECT user_id, revision FROM user_revisions",
+)
+# One pass over the rating index for many users; same order as page_by_rating.
+_MOVIES_GROUPED = _statement("movies_grouped", """
+  SELECT m.user_id, m.title, m.year, m.rating, c.poster
+  FROM movies AS m
+  JOIN catalog AS c ON c.id = m.catalog_id
+  WHERE m.user_id IN :user_ids
+  ORDER BY m.user_id, m.rating DESC, m.id
+""", expanding=("user_ids",))
+_COUNT_MOVIES = _statement(
+  "count_movies",
+  "SELECT movie_count FROM user_stats WHERE user_id = :user_id",
+)
+_ALL_MOVIE_COUNTS = _statement(
+  "all_movie_counts",
+  "SELECT user_id, movie_count FROM user_stats",
+)
+# Keyset pagination, one statement per sort order; each walks an index and
+# continues strictly after the (key, id) of the previous page's last row.
+_PAGE_QUERIES: Dict[str, TextClause] = {
+  "title": _statement("page_by_title", """
+    SELECT m.title, m.year, m.rating, c.poster, m.id, m.title
+    FROM movies AS m
+    JOIN catalog AS c ON c.id = m.catalog_id
+    WHERE m.user_id = :user_id AND m.title > :key
+    ORDER BY m.title
+    LIMIT :limit
+  """),
+  "rating": _statement("page_by_rating", """
+    SELECT m.title, m.year, m.rating, c.poster, m.id, m.rating
+    FROM movies AS m
+    JOIN catalog AS c ON c.id = m.catalog_id
+    WHERE m.user_id = :user_id AND m.rating <= :key AND (m.rating < :key OR m.id > :id)
+    ORDER BY m.rating DESC, m.id
+    LIMIT :limit
+  """),
+  "year": _statement("page_by_year", """
+    SELECT m.title, m.year, m.rating, c.poster, m.id, m.year
+    FROM movies AS m
+    JOIN catalog AS c ON c.id = m.catalog_id
+    WHERE m.user_id = :user_id AND m.year >= :key AND (m.year > :key OR m.id > :id)
+    ORDER BY m.year, m.id
+    LIMIT :limit
+  """),
+}
+# Cursor used for the first page of each order.
+_FIRST_KEYS: Dict[str, PageCursor] = {
+  "title": ("", 0),
+  "rating": (float("inf"), 0),
+  "year": (-(2 ** 62), 0),
+}
+_RATING_COLUMNS = _statement("rating_columns", """
+  SELECT rating, year FROM movies WHERE user_id = :user_id
+""")
+_ADD_MOVIE = _statement("add_movie", """
+  INSERT INTO movies (user_id, catalog_id, title, year, rating)
+  VALUES (:user_id, :catalog_id, :title, :year, :rating)
+""")
+_DELETE_MOVIE = _statement(
+  "delete_movie",
+  "DELETE FROM movies WHERE user_id = :user_id AND title = :title",
+)
+_UPDATE_MOVIE = _statement(
+  "update_movie",
+  """
+  UPDATE movies SET rating = :rating, personal_rating = :rating
+  WHERE user_id = :user_id AND title = :title
+  """,
+)
+_EXISTING_TITLES = _statement("existing_titles", """
+  SELECT title FROM movies
+  WHERE user_id = :user_id AND title IN :titles
+""", expanding=("titles",))
+_ADD_MOVIE_IGNORE = _statement("add_movie_ignore", """
+  INSERT INTO movies (user_id, catalog_id, title, year, rating)
+  VALUES (:user_id, :catalog_id, :title, :year, :rating)
+  ON CONFLICT(user_id, title) DO NOTHING
+""")
+_CATALOG_BY_IMDB_IDS = _statement("catalog_by_imdb_ids", """
+  SELECT id, imdb_id, title, year, rating, poster
+  FROM catalog
+  WHERE imdb_id IN :imdb_ids
+""", expanding=("imdb_ids",))
+_GET_CATALOG_MOVIE = _statement("get_catalog_movie", """
+  SELECT id, imdb_id, title, year, rating, poster, refreshed_at
+  FROM catalog
+  WHERE imdb_id = :imdb_id
+""")
+# An IMDb id already in the catalog keeps its row; rows without one never conflict.
+_INSERT_CATALOG = _statement("insert_catalog", """
+  INSERT INTO catalog (imdb_id, title, year, rating, poster, refreshed_at)
+  VALUES (:imdb_id, :title, :year, :rating, :poster, :refreshed_at)
+  ON CONFLICT(imdb_id) DO NOTHING
+""")
+# Ids of the last :count catalog rows; inside a write transaction these are
+# the rows it just inserted (AUTOINCREMENT ids only grow).
+_LAST_CATALOG_IDS = _statement("last_catalog_ids", """
+  SELECT id FROM catalog ORDER BY id DESC LIMIT :count
+""")
+_CATALOG_USERS = _statement("catalog_users", """
+  SELECT DISTINCT user_id FROM movies WHERE catalog_id IN :catalog_ids
+""", expanding=("catalog_ids",))
+_DELETE_UNUSED_CATALOG = _statement("delete_unused_catalog", """
+  DELETE FROM catalog
+  WHERE id IN :catalog_ids
+    AND imdb_id IS NULL
+    AND NOT EXISTS (SELECT 1 FROM movies WHERE movies.catalog_id = catalog.id)
+""", expanding=("catalog_ids",))
+
+
+# ---------- Cache ----------
+
+# Upper bound for the number of movies held across all cached users.
+CACHE_MAX_MOVIES = 500_000
+# Upper bound for the memory of all cached title indexes (~45 MB per 100k titles).
+INDEX_CACHE_MAX_BYTES = 128 * 1024 * 1024
+
+_cache: "OrderedDict[int, Tuple[int, MovieTable]]" = OrderedDict()   # (revision, movies)
+_cache_lock = threading.RLock()
+_title_indexes: "OrderedDict[int, Tuple[int, TitleIndex]]" = OrderedDict()   # (revision, index)
+_cache_counters = {"hits": 0, "misses": 0, "movies": 0, "index_bytes": 0, "writes": 0}
+
+
+def cache_info() -> CacheInfo:
+  """Return hit/miss counters and the current size of the movie cache."""
+  with _cache_lock:
+    return {
+      "hits": _cache_counters["hits"],
+      "misses": _cache_counters["misses"],
+      "users": len(_cache),
+      "movies": _cache_counters["movies"],
+      "max_movies": CACHE_MAX_MOVIES,
+      "index_bytes": _cache_counters["index_bytes"],
+      "max_index_bytes": INDEX_CACHE_MAX_BYTES,
+    }
+
+
+def clear_cache() -> None:
+  """Drop all cached snapshots (counters are kept)."""
+  with _cache_lock:
+    _cache.clear()
+    _title_indexes.clear()
+    _cache_counters["movies"] = 0
+    _cache_counters["index_bytes"] = 0
+    _cache_counters["writes"] += 1
+
+
+def _cache_store(user_id: int, movies: MovieTable, revision: int, writes_seen: int) -> None:
+  """Cache a freshly loaded snapshot unless a write happened meanwhile."""
+  with _cache_lock:
+    if writes_seen != _cache_counters["writes"] or len(movies) > CACHE_MAX_MOVIES:
+      return
+    _drop_movies(user_id)
+    _cache[user_id] = (revision, movies)
+    _cache_counters["movies"] += len(movies)
+    while _cache_counters["movies"] > CACHE_MAX_MOVIES:
+      _, (_, evicted) = _cache.popitem(last=False)
+      _cache_counters["movies"] -= len(evicted)
+
+
+def _drop_movies(user_id: int) -> None:
+  cached = _cache.pop(user_id, None)
+  if cached is not None:
+    _cache_counters["movies"] -= len(cached[1])
+
+
+def _evict_indexes() -> None:
+  """Drop the least recently used title indexes until they fit the cap."""
+  while _cache_counters["index_bytes"] > INDEX_CACHE_MAX_BYTES and _title_indexes:
+    _, (_, evicted) = _title_indexes.popitem(last=False)
+    _cache_counters["index_bytes"] -= evicted.nbytes
+
+
+def _drop_index(user_id: int) -> None:
+  cached = _title_indexes.pop(user_id, None)
+  if cached is not None:
+    _cache_counters["index_bytes"] -= cached[1].nbytes
+
+
+def _cache_store_index(user_id: int, index: TitleIndex, revision: int, writes_seen: int) -> None:
+  """Cache a freshly built title index unless a write happened meanwhile."""
+  with _cache_lock:
+    if writes_seen != _cache_counters["writes"] or index.nbytes > INDEX_CACHE_MAX_BYTES:
+      return
+    _drop_index(user_id)
+    _title_indexes[user_id] = (revision, index)
+    _cache_counters["index_bytes"] += index.nbytes
+    _evict_indexes()
 
-_init_db()
+
+def _cache_put(user_id: int, title: str, record: MovieRecord, revisions: Tuple[int, int]) -> None:
+  """Insert or replace one movie in a cached snapshot.
+
+  `revisions` is the user's revision (before, after) the write; a snapshot
+  read at another revision missed a change made elsewhere and is dropped.
+  """
+  before, after = revisions
+  with _cache_lock:
+    _cache_counters["writes"] += 1
+    cached_index = _title_indexes.get(user_id)
+    if cached_index is not None and cached_index[0] != before:
+      _drop_index(user_id)
+    elif cached_index is not None:
+      index = cached_index[1]
+      size = index.nbytes
+      index.add(title)
+      _title_indexes[user_id] = (after, index)
+      _cache_counters["index_bytes"] += index.nbytes - size
+      _evict_indexes()
+    cached = _cache.get(user_id)
+    if cached is None:
+      return
+    if cached[0] != before:
+      _drop_movies(user_id)
+      return
+    movies = cached[1]
+    if title not in movies:
+      _cache_counters["movies"] += 1
+    movies.put(title, record)
+    _cache[user_id] = (after, movies)
+
+
+def _cache_remove(user_id: int, title: str, revisions: Tuple[int, int]) -> None:
+  """Remove one movie from a cached snapshot (`revisions` as in _cache_put)."""
+  before, after = revisions
+  with _cache_lock:
+    _cache_counters["writes"] += 1
+    cached_index = _title_indexes.get(user_id)
+    if cached_index is not None and cached_index[0] != before:
+      _drop_index(user_id)
+    elif cached_index is not None:
+      index = cached_index[1]
+      size = index.nbytes
+      index.remove(title)
+      _title_indexes[user_id] = (after, index)
+      _cache_counters["index_bytes"] += index.nbytes - size
+    cached = _cache.get(user_id)
+    if cached is None:
+      return
+    if cached[0] != before:
+      _drop_movies(user_id)
+      return
+    if cached[1].remove(title):
+      _cache_counters["movies"] -= 1
+    _cache[user_id] = (after, cached[1])
+
+
+def _cache_invalidate(user_id: int) -> None:
+  """Forget the cached snapshot of one user."""
+  with _cache_lock:
+    _cache_counters["writes"] += 1
+    _drop_movies(user_id)
+    _drop_index(user_id)
 
 
 # ---------- Users ----------
 
 def list_users() -> List[Tuple[int, str]]:
   """Return list of (id, name)."""
-  with engine.connect() as connection:
-    result = connection.execute(text("SELECT id, name FROM users ORDER BY name"))
+  with get_engine().connect() as connection:
+    result = connection.execute(_LIST_USERS)
     return [(int(r[0]), str(r[1])) for r in result.fetchall()]
 
 
 def create_user(name: str) -> int:
   """Create user and return its id."""
   try:
-    with engine.begin() as connection:
-      connection.execute(
-        text("INSERT INTO users (name) VALUES (:name)"),
-        {"name": name},
-      )
+    with get_engine().begin() as connection:
+      connection.execute(_CREATE_USER, {"name": name})
   except IntegrityError:
     raise ValueError("User existiert bereits.") from None
 
@@ -93,61 +1050,961 @@ def create_user(name: str) -> int:
 
 def get_user_id(name: str) -> Optional[int]:
   """Get user id by name."""
-  with engine.connect() as connection:
-    result = connection.execute(
-      text("SELECT id FROM users WHERE name = :name"),
-      {"name": name},
-    ).fetchone()
+  with get_engine().connect() as connection:
+    result = connection.execute(_GET_USER_ID, {"name": name}).fetchone()
   return int(result[0]) if result else None
 
 
 # ---------- Movies ----------
 
 def get_movies(user_id: int) -> MovieData:
-  """Retrieve all movies for a given user."""
-  with engine.connect() as connection:
-    result = connection.execute(text("""
-      SELECT title, year, rating, poster
-      FROM movies
-      WHERE user_id = :user_id
-    """), {"user_id": user_id})
-    rows = result.fetchall()
+  """Retrieve all movies for a given user.
+
+  Returns the cached, array-backed snapshot in title order; it reflects
+  later add/delete/update calls for the same user and is reloaded when the
+  user's revision changed otherwise (one primary-key lookup per call).
+  """
+  with get_engine().connect() as connection:
+    revision = _revision_in(connection, user_id)
+    with _cache_lock:
+      cached = _cache.get(user_id)
+      if cached is not None and cached[0] == revision:
+        _cache.move_to_end(user_id)
+        _cache_counters["hits"] += 1
+        return cached[1]
+      _cache_counters["misses"] += 1
+      writes_seen = _cache_counters["writes"]
+
+    result = connection.execute(_GET_MOVIES, {"user_id": user_id})
+    movies = MovieTable(
+      (str(row[0]), {"year": int(row[1]), "rating": float(row[2]), "poster": str(row[3])})
+      for row in result
+    )
+
+  _cache_store(user_id, movies, revision, writes_seen)
+  return movies
+
+
+def count_movies(user_id: int) -> int:
+  """Return how many movies the user has (from the stats summary)."""
+  with get_engine().connect() as connection:
+    count = connection.execute(_COUNT_MOVIES, {"user_id": user_id}).scalar()
+  return int(count or 0)
+
+
+def movie_counts() -> Dict[int, int]:
+  """Return count_movies() of every user that has a stats row, in one query."""
+  with get_engine().connect() as connection:
+    return {int(row[0]): int(row[1]) for row in connection.execute(_ALL_MOVIE_COUNTS)}
+
+
+def database_id() -> str:
+  """Return the random id given to this database when it was created."""
+  with get_engine().connect() as connection:
+    return str(connection.execute(_DATABASE_ID).scalar())
+
+
+def user_revision(user_id: int) -> int:
+  """Return the user's revision; it takes a new random value with every change to their movies.
+
+  Covers title, year, rating and poster (also when changed via the shared
+  catalog), so equal revisions (in the same database_id()) mean an
+  unchanged collection.
+  """
+  with get_engine().connect() as connection:
+    return _revision_in(connection, user_id)
+
+
+def _revision_in(connection: Any, user_id: int) -> int:
+  return int(connection.execute(_USER_REVISION, {"user_id": user_id}).scalar() or 0)
+
+
+def user_revisions() -> Dict[int, int]:
+  """Return user_revision() of every user in one query."""
+  with get_engine().connect() as connection:
+    return {int(row[0]): int(row[1]) for row in connection.execute(_ALL_USER_REVISIONS)}
+
+
+def iter_movies_grouped(
+  user_ids: Iterable[int],
+  chunk_size: int = 500,
+) -> Iterator[Tuple[int, List[Tuple[str, MovieRecord]]]]:
+  """Yield (user_id, movies) for the given users in ascending id order.
+
+  Movies are ordered by rating (desc) like iter_movies(order_by="rating");
+  users without movies get an empty list. One query per `chunk_size` users.
+  """
+  ordered = sorted(set(user_ids))
+  for start in range(0, len(ordered), chunk_size):
+    chunk = ordered[start:start + chunk_size]
+    pending = iter(chunk)
+    current: Optional[int] = None
+    movies: List[Tuple[str, MovieRecord]] = []
+    with get_engine().connect() as connection:
+      for row in connection.execute(_MOVIES_GROUPED, {"user_ids": chunk}):
+        user_id = int(row[0])
+        if user_id != current:
+          if current is not None:
+            yield current, movies
+          for skipped in pending:       # users without movies come first
+            if skipped == user_id:
+              break
+            yield skipped, []
+          current, movies = user_id, []
+        movies.append(
+          (str(row[1]), {"year": int(row[2]), "rating": float(row[3]), "poster": str(row[4])})
+        )
+    if current is not None:
+      yield current, movies
+    for skipped in pending:
+      yield skipped, []
+
+
+def page(
+  user_id: int,
+  after: Optional[PageCursor] = None,
+  limit: int = 50,
+  order_by: str = "title",
+) -> MoviePage:
+  """Return one page of movies ordered by title, rating (desc) or year.
+
+  Pass the returned `next` cursor as `after` to get the following page;
+  `next` is None on the last page. Raises ValueError for limit < 1 (also
+  via iter_movies' page_size and top_movies' n).
+  """
+  if order_by not in _PAGE_QUERIES:
+    raise ValueError(f"Unbekannte Sortierung: {order_by!r}")
+  if limit < 1:
+    raise ValueError("limit muss mindestens 1 sein.")
+  key, last_id = after if after is not None else _FIRST_KEYS[order_by]
+
+  with get_engine().connect() as connection:
+    rows = connection.execute(
+      _PAGE_QUERIES[order_by],
+      {"user_id": user_id, "key": key, "id": last_id, "limit": limit},
+    ).fetchall()
+
+  movies = [
+    (str(row[0]), {"year": int(row[1]), "rating": float(row[2]), "poster": str(row[3])})
+    for row in rows
+  ]
+  next_cursor = (rows[-1][5], int(rows[-1][4])) if len(rows) == limit else None
+  return {"movies": movies, "next": next_cursor}
+
+
+def iter_movies(
+  user_id: int,
+  order_by: str = "title",
+  page_size: int = 1000,
+) -> Iterator[Tuple[str, MovieRecord]]:
+  """Stream a user's movies page by page; at most one page is held in memory."""
+  after: Optional[PageCursor] = None
+  while True:
+    result = page(user_id, after=after, limit=page_size, order_by=order_by)
+    yield from result["movies"]
+    after = result["next"]
+    if after is None:
+      return
+
+
+def top_movies(user_id: int, n: int = 20, order_by: str = "rating") -> List[Tuple[str, MovieRecord]]:
+  """Return the first `n` movies in index order (highest rated by default)."""
+  return page(user_id, limit=n, order_by=order_by)["movies"]
+
+
+def find_movie(
+  user_id: int,
+  title: str,
+  case_insensitive: bool = True,
+) -> Optional[Tuple[str, MovieRecord]]:
+  """Look up one movie by title via the index; returns (stored title, record)."""
+  query = _FIND_MOVIE_NOCASE if case_insensitive else _FIND_MOVIE
+  with get_engine().connect() as connection:
+    row = connection.execute(query, {"user_id": user_id, "title": title.strip()}).fetchone()
+  if row is None:
+    return None
+  return str(row[0]), {"year": int(row[1]), "rating": float(row[2]), "poster": str(row[3])}
+
+
+def movie_exists(user_id: int, title: str, case_insensitive: bool = True) -> bool:
+  """Check whether the user already has a movie with this title."""
+  query = _MOVIE_EXISTS_NOCASE if case_insensitive else _MOVIE_EXISTS
+  with get_engine().connect() as connection:
+    row = connection.execute(query, {"user_id": user_id, "title": title.strip()}).fetchone()
+  return row is not None
+
+
+def _fts_query(user_id: int, query: str) -> Optional[str]:
+  """Build an FTS5 MATCH expression: every word of `query` as a title prefix."""
+  tokens = _SEARCH_TOKEN_PATTERN.findall(query)
+  if not tokens:
+    return None
+  terms = " AND ".join(f'"{token}"*' for token in tokens)
+  return f'user_id : "{int(user_id)}" AND title : ({terms})'
+
+
+def search_movies(user_id: int, query: str, limit: int = 50) -> List[Tuple[str, MovieRecord]]:
+  """Full-text search over the user's titles, best bm25 matches first.
+
+  Every word in `query` must match the start of a word in the title, so
+  "dark kni" finds "The Dark Knight".
+  """
+  match = _fts_query(user_id, query)
+  if match is None:
+    return []
+  with get_engine().connect() as connection:
+    rows = connection.execute(
+      _SEARCH_MOVIES,
+      {"user_id": user_id, "query": match, "limit": limit},
+    ).fetchall()
+  return [
+    (str(row[0]), {"year": int(row[1]), "rating": float(row[2]), "poster": str(row[3])})
+    for row in rows
+  ]
+
+
+def suggest_titles(user_id: int, query: str, n: int = 5, cutoff: float = 0.6) -> List[str]:
+  """Suggest up to `n` titles similar to `query` ("Meinst du ...?").
+
+  Same result as difflib.get_close_matches over the user's titles, served
+  by their title index (see storage.title_index), which is built once and
+  then kept up to date, or rebuilt when the user's revision changed.
+  """
+  from storage.title_index import TitleIndex  # pylint: disable=import-outside-toplevel
+
+  with get_engine().connect() as connection:
+    revision = _revision_in(connection, user_id)
+    with _cache_lock:
+      cached = _title_indexes.get(user_id)
+      if cached is not None and cached[0] == revision:
+        _title_indexes.move_to_end(user_id)
+        return cached[1].close_matches(query, n=n, cutoff=cutoff)
+      writes_seen = _cache_counters["writes"]
+    titles = [str(row[0]) for row in connection.execute(_LIST_TITLES, {"user_id": user_id})]
+
+  index = TitleIndex(titles)
+  _cache_store_index(user_id, index, revision, writes_seen)
+  return index.close_matches(query, n=n, cutoff=cutoff)
+
+
+def _read_buckets(connection: Any, user_id: int) -> List[int]:
+  counts = [0] * HISTOGRAM_BUCKETS
+  for bucket, movie_count in connection.execute(_RATING_BUCKETS, {"user_id": user_id}):
+    counts[int(bucket)] = int(movie_count)
+  return counts
+
+
+def _median(connection: Any, user_id: int, count: int) -> float:
+  """Median via the histogram: only the median's bucket is walked in the index."""
+  position = (count - 1) // 2
+  low = float("-inf")
+  for bucket, bucket_count in enumerate(_read_buckets(connection, user_id)):
+    if position < bucket_count:
+      low = float("-inf") if bucket == 0 else float(bucket)
+      break
+    position -= bucket_count
+  ratings = [
+    float(row[0])
+    for row in connection.execute(
+      _RATINGS_FROM, {"user_id": user_id, "low": low, "offset": position}
+    )
+  ]
+  if count % 2 or len(ratings) < 2:
+    return ratings[0]
+  return (ratings[0] + ratings[1]) / 2
+
+
+def rating_stats(user_id: int) -> Optional[RatingStats]:
+  """Return rating statistics; None if the user has no movies.
+
+  count, avg, min and max come from the user_stats summary row; the median
+  walks one histogram bucket of the rating index. Only the titles of the
+  best and worst rated movies are sent to Python.
+  """
+  with get_engine().connect() as connection:
+    summary = connection.execute(_USER_STATS, {"user_id": user_id}).fetchone()
+    if summary is None or not summary[0]:
+      return None
+    count, rating_sum, min_rating, max_rating = summary
+    avg = rating_sum / count
+    median = _median(connection, user_id, int(count))
+    best = connection.execute(_TITLES_WITH_RATING, {"user_id": user_id, "rating": max_rating})
+    best_titles = [str(row[0]) for row in best]
+    worst = connection.execute(_TITLES_WITH_RATING, {"user_id": user_id, "rating": min_rating})
+    worst_titles = [str(row[0]) for row in worst]
 
   return {
-    str(row[0]): {"year": int(row[1]), "rating": float(row[2]), "poster": str(row[3])}
+    "count": int(count),
+    "avg": float(avg),
+    "median": float(median),
+    "min": float(min_rating),
+    "max": float(max_rating),
+    "best": best_titles,
+    "worst": worst_titles,
+  }
+
+
+def rating_histogram(user_id: int) -> List[int]:
+  """Return the number of movies per rating bucket ([0, 1), [1, 2), ... [9, 10])."""
+  with get_engine().connect() as connection:
+    return _read_buckets(connection, user_id)
+
+
+# Give up weighted sampling after this many rejected draws per requested movie
+# (only reachable if nearly all remaining movies have a rating <= 0).
+_MAX_REJECTIONS_PER_PICK = 1000
+
+
+def _movies_at_slots(
+  connection: Any,
+  user_id: int,
+  slots: List[int],
+) -> Dict[int, Tuple[str, MovieRecord]]:
+  rows = connection.execute(_MOVIES_AT_SLOTS, {"user_id": user_id, "slots": slots})
+  return {
+    int(row[0]): (str(row[1]), {"year": int(row[2]), "rating": float(row[3]), "poster": str(row[4])})
     for row in rows
   }
 
 
-def add_movie(user_id: int, title: str, year: int, rating: float, poster: str) -> None:
-  """Add a new movie for a user."""
+def random_movie(
+  user_id: int,
+  k: int = 1,
+  weighted_by: Optional[str] = None,
+) -> List[Tuple[str, MovieRecord]]:
+  """Pick up to `k` distinct random movies without loading the collection.
+
+  Movies are addressed by their dense per-user slot number, so each pick is
+  one index lookup. With weighted_by="rating" the chance of a movie is
+  proportional to its rating (rejection sampling against the max rating).
+  """
+  if weighted_by not in (None, "rating"):
+    raise ValueError(f"Unbekannte Gewichtung: {weighted_by!r}")
+
+  with get_engine().connect() as connection:
+    summary = connection.execute(_USER_STATS, {"user_id": user_id}).fetchone()
+    count = int(summary[0]) if summary else 0
+    k = min(k, count)
+    if k <= 0:
+      return []
+
+    max_rating = float(summary[3]) if summary[3] is not None else 0.0
+    if weighted_by is None or max_rating <= 0:
+      slots = random.sample(range(count), k)
+      found = _movies_at_slots(connection, user_id, slots)
+      return [found[slot] for slot in slots if slot in found]
+
+    picked: List[Tuple[str, MovieRecord]] = []
+    seen: set[int] = set()
+    rejections = 0
+    while len(picked) < k and rejections < _MAX_REJECTIONS_PER_PICK * k:
+      slot = random.randrange(count)
+      if slot in seen:
+        continue
+      found = _movies_at_slots(connection, user_id, [slot])
+      if slot in found and random.random() * max_rating < found[slot][1]["rating"]:
+        seen.add(slot)
+        picked.append(found[slot])
+      else:
+        rejections += 1
+    return picked
+
+
+def iter_rating_rows(user_id: int) -> Iterator[Tuple[float, int]]:
+  """Yield (rating, year) tuples straight from the DBAPI cursor.
+
+  Skips SQLAlchemy's Row wrapping, so bulk consumers like numpy.fromiter
+  read the columns at C speed.
+  """
+  with get_engine().connect() as connection:
+    cursor = connection.connection.cursor()
+    try:
+      cursor.execute(_RATING_COLUMNS.text, {"user_id": user_id})
+      yield from cursor
+    finally:
+      cursor.close()
+
+
+def _catalog_entry(record: Mapping[str, Any], refreshed_at: float) -> Dict[str, Any]:
+  imdb_id = str(record.get("imdb_id") or "").strip() or None
+  year = int(record["year"])
+  if not YEAR_MIN <= year <= YEAR_MAX:
+    raise ValueError(f"Ungültiges Jahr: {year}")
+  return {
+    "imdb_id": imdb_id,
+    "title": str(record["title"]),
+    "year": year,
+    "rating": float(record["rating"]),
+    "poster": str(record.get("poster") or ""),
+    "refreshed_at": refreshed_at if imdb_id else None,
+  }
+
+
+def _link_catalog(connection: Any, entries: List[Dict[str, Any]]) -> List[int]:
+  """Find or create the catalog row of every entry (see _catalog_entry).
+
+  Entries with an IMDb id share one row per film. A row that already exists
+  is left as it is (catalog_refresh keeps it current; the caller's data may
+  come from an older cached response) and the entry takes over its rating
+  and poster. Entries without an IMDb id get a private row each.
+  Returns the catalog id per entry.
+  """
+  shared: Dict[str, Dict[str, Any]] = {}
+  private: List[Dict[str, Any]] = []
+  for entry in entries:
+    if entry["imdb_id"] is None:
+      private.append(entry)
+    else:
+      shared.setdefault(entry["imdb_id"], entry)
+
+  existing: Dict[str, Tuple[int, float, str]] = {}
+  if shared:
+    connection.execute(_INSERT_CATALOG, list(shared.values()))
+    for row in connection.execute(_CATALOG_BY_IMDB_IDS, {"imdb_ids": sorted(shared)}):
+      existing[str(row[1])] = (int(row[0]), float(row[4]), str(row[5]))
+  private_ids: List[int] = []
+  if private:
+    connection.execute(_INSERT_CATALOG, private)
+    rows = connection.execute(_LAST_CATALOG_IDS, {"count": len(private)})
+    private_ids = sorted(int(row[0]) for row in rows)
+
+  ids: List[int] = []
+  next_private = iter(private_ids)
+  for entry in entries:
+    if entry["imdb_id"] is None:
+      ids.append(next(next_private))
+    else:
+      catalog_id, entry["rating"], entry["poster"] = existing[entry["imdb_id"]]
+      ids.append(catalog_id)
+  return ids
+
+
+def _catalog_users(connection: Any, catalog_ids: List[int]) -> List[int]:
+  """User ids whose snapshots show one of these catalog rows."""
+  if not catalog_ids:
+    return []
+  rows = connection.execute(_CATALOG_USERS, {"catalog_ids": catalog_ids})
+  return [int(row[0]) for row in rows]
+
+
+def add_movie(
+  user_id: int,
+  title: str,
+  year: int,
+  rating: float,
+  poster: str,
+  imdb_id: Optional[str] = None,
+) -> None:
+  """Add a new movie for a user.
+
+  With an imdb_id the film's catalog row is shared with every other user
+  who has it; if the film is already in the catalog, its stored rating and
+  poster are used instead of the given ones. Without an imdb_id the movie
+  gets a private catalog row.
+  """
+  entry = _catalog_entry(
+    {"title": title, "year": year, "rating": rating, "poster": poster, "imdb_id": imdb_id},
+    time.time(),
+  )
   try:
-    with engine.begin() as connection:
-      connection.execute(text("""
-        INSERT INTO movies (user_id, title, year, rating, poster)
-        VALUES (:user_id, :title, :year, :rating, :poster)
-      """), {"user_id": user_id, "title": title, "year": year, "rating": rating, "poster": poster})
+    with _write_transaction() as connection:
+      before = _revision_in(connection, user_id)
+      (catalog_id,) = _link_catalog(connection, [entry])
+      connection.execute(
+        _ADD_MOVIE,
+        {
+          "user_id": user_id,
+          "catalog_id": catalog_id,
+          "title": title,
+          "year": entry["year"],
+          "rating": entry["rating"],
+        },
+      )
+      after = _revision_in(connection, user_id)
   except IntegrityError:
     raise ValueError("Film existiert bereits für diesen User.") from None
+  _cache_put(
+    user_id, title,
+    {"year": entry["year"], "rating": entry["rating"], "poster": entry["poster"]},
+    (before, after),
+  )
 
 
 def delete_movie(user_id: int, title: str) -> None:
   """Delete a movie for a user."""
-  with engine.begin() as connection:
-    result = connection.execute(
-      text("DELETE FROM movies WHERE user_id = :user_id AND title = :title"),
-      {"user_id": user_id, "title": title},
-    )
+  with _write_transaction() as connection:
+    before = _revision_in(connection, user_id)
+    result = connection.execute(_DELETE_MOVIE, {"user_id": user_id, "title": title})
+    after = _revision_in(connection, user_id)
   if result.rowcount == 0:
     raise KeyError("Film nicht gefunden.")
+  _cache_remove(user_id, title, (before, after))
 
 
 def update_movie(user_id: int, title: str, rating: float) -> None:
   """Update rating for a user's movie."""
-  with engine.begin() as connection:
+  with _write_transaction() as connection:
+    before = _revision_in(connection, user_id)
     result = connection.execute(
-      text("UPDATE movies SET rating = :rating WHERE user_id = :user_id AND title = :title"),
+      _UPDATE_MOVIE,
       {"user_id": user_id, "title": title, "rating": rating},
     )
+    after = _revision_in(connection, user_id)
   if result.rowcount == 0:
     raise KeyError("Film nicht gefunden.")
+  with _cache_lock:
+    cached = _cache.get(user_id)
+    record = cached[1].get(title) if cached is not None else None
+    if record is not None:
+      _cache_put(user_id, title, {**record, "rating": float(rating)}, (before, after))
+    else:
+      _cache_invalidate(user_id)
+
+
+def add_movies_bulk(
+  user_id: int,
+  records: Iterable[Mapping[str, Any]],
+  batch_size: int = 5000,
+) -> BulkInsertResult:
+  """Insert many movies for a user using one executemany per batch.
+
+  `records` may be any iterable (e.g. a generator) of mappings with the keys
+  title, year, rating, poster and optionally imdb_id (a FetchedMovie works
+  as is). Each batch runs in its own transaction.
+  Titles that already exist for the user, or repeat within the input, are
+  skipped and reported in `conflicts` instead of aborting the batch.
+  """
+  if batch_size < 1:
+    raise ValueError("batch_size muss mindestens 1 sein.")
+
+  total = 0
+  inserted = 0
+  conflicts: List[str] = []
+  iterator = iter(records)
+
+  while True:
+    batch = list(islice(iterator, batch_size))
+    if not batch:
+      break
+    total += len(batch)
+
+    now = time.time()
+    entries: List[Dict[str, Any]] = []
+    seen: set[str] = set()
+    for record in batch:
+      entry = _catalog_entry(record, now)
+      if entry["title"] in seen:
+        conflicts.append(entry["title"])
+        continue
+      seen.add(entry["title"])
+      entries.append(entry)
+
+    with _write_transaction() as connection:
+      existing = {
+        str(row[0])
+        for row in connection.execute(
+          _EXISTING_TITLES, {"user_id": user_id, "titles": [entry["title"] for entry in entries]}
+        )
+      }
+      if existing:
+        conflicts.extend(entry["title"] for entry in entries if entry["title"] in existing)
+        entries = [entry for entry in entries if entry["title"] not in existing]
+      if entries:
+        catalog_ids = _link_catalog(connection, entries)
+        rows = [
+          {
+            "user_id": user_id,
+            "catalog_id": catalog_id,
+            "title": entry["title"],
+            "year": entry["year"],
+            "rating": entry["rating"],
+          }
+          for entry, catalog_id in zip(entries, catalog_ids)
+        ]
+        result = connection.execute(_ADD_MOVIE_IGNORE, rows)
+        inserted += result.rowcount
+        if result.rowcount < len(rows):
+          # Lost to a concurrent writer: drop the private rows made for them.
+          connection.execute(_DELETE_UNUSED_CATALOG, {"catalog_ids": catalog_ids})
+    if entries:
+      _cache_invalidate(user_id)
+
+  # skipped also covers rows lost to a concurrent writer between SELECT and INSERT.
+  return {"inserted": inserted, "skipped": total - inserted, "conflicts": conflicts}
+
+
+def get_catalog_movie(imdb_id: str) -> Optional[CatalogMovie]:
+  """Look up a film in the shared catalog by its IMDb id."""
+  with get_engine().connect() as connection:
+    row = connection.execute(_GET_CATALOG_MOVIE, {"imdb_id": imdb_id.strip()}).fetchone()
+  if row is None:
+    return None
+  return {
+    "id": int(row[0]),
+    "imdb_id": str(row[1]),
+    "title": str(row[2]),
+    "year": int(row[3]),
+    "rating": float(row[4]),
+    "poster": str(row[5]),
+    "refreshed_at": float(row[6]) if row[6] is not None else None,
+  }
+
+
+# ---------- Catalog refresh ----------
+
+_OPEN_REFRESH_RUN = _statement("open_refresh_run", """
+  SELECT id, started_at, cutoff, last_key, last_id, processed, updated, failed
+  FROM catalog_refresh_runs
+  WHERE finished_at IS NULL
+  ORDER BY id DESC
+  LIMIT 1
+""")
+_START_REFRESH_RUN = _statement("start_refresh_run", """
+  INSERT INTO catalog_refresh_runs (started_at, cutoff) VALUES (:started_at, :cutoff)
+""")
+_CHECKPOINT_REFRESH_RUN = _statement("checkpoint_refresh_run", """
+  UPDATE catalog_refresh_runs
+  SET last_key = :last_key, last_id = :last_id,
+      processed = processed + :processed, updated = updated + :updated,
+      failed = failed + :failed
+  WHERE id = :id
+""")
+_FINISH_REFRESH_RUN = _statement("finish_refresh_run", """
+  UPDATE catalog_refresh_runs SET finished_at = :finished_at WHERE id = :id
+""")
+# Entries in use, stalest first, strictly after the checkpoint. Rows without
+# IMDb id are only refreshed (by title) if they came from OMDb, i.e. have a
+# poster; manual entries keep the data the user typed.
+_REFRESH_CANDIDATES = _statement("refresh_candidates", """
+  SELECT id, imdb_id, title, year, rating, poster, refreshed_at
+  FROM catalog
+  WHERE COALESCE(refreshed_at, 0) < :cutoff
+    AND COALESCE(refreshed_at, 0) >= :key
+    AND (COALESCE(refreshed_at, 0) > :key OR id > :id)
+    AND (imdb_id IS NOT NULL OR poster != '')
+    AND EXISTS (SELECT 1 FROM movies WHERE movies.catalog_id = catalog.id)
+  ORDER BY COALESCE(refreshed_at, 0), id
+  LIMIT :limit
+""")
+_CATALOG_BY_IDS = _statement("catalog_by_ids", """
+  SELECT id, imdb_id, rating, poster FROM catalog WHERE id IN :ids
+""", expanding=("ids",))
+_TOUCH_CATALOG = _statement("touch_catalog", """
+  UPDATE catalog SET refreshed_at = :refreshed_at WHERE id = :id
+""")
+_REFRESH_CATALOG = _statement("refresh_catalog", """
+  UPDATE catalog
+  SET imdb_id = COALESCE(imdb_id, :imdb_id), rating = :rating, poster = :poster,
+      refreshed_at = :refreshed_at
+  WHERE id = :id
+""")
+# Moves the movies of a duplicate entry (found to be the same IMDb film)
+# over to the shared one; they follow its rating unless rated personally.
+_MERGE_CATALOG_MOVIES = _statement("merge_catalog_movies", """
+  UPDATE movies
+  SET catalog_id = :into_id,
+      rating = CASE WHEN personal_rating IS NULL
+        THEN (SELECT rating FROM catalog WHERE id = :into_id)
+        ELSE rating END
+  WHERE catalog_id = :from_id
+""")
+_DELETE_CATALOG = _statement("delete_catalog", "DELETE FROM catalog WHERE id = :id")
+
+
+def _refresh_run(row: Any) -> RefreshRun:
+  return {
+    "id": int(row[0]),
+    "started_at": float(row[1]),
+    "cutoff": float(row[2]),
+    "cursor": (float(row[3]), int(row[4])),
+    "processed": int(row[5]),
+    "updated": int(row[6]),
+    "failed": int(row[7]),
+  }
+
+
+def open_refresh_run(max_age: float) -> RefreshRun:
+  """Return the unfinished refresh run, or start one for entries older than max_age seconds.
+
+  A resumed run keeps its original cutoff and checkpoint.
+  """
+  with _write_transaction() as connection:
+    row = connection.execute(_OPEN_REFRESH_RUN).fetchone()
+    if row is None:
+      now = time.time()
+      connection.execute(_START_REFRESH_RUN, {"started_at": now, "cutoff": now - max_age})
+      row = connection.execute(_OPEN_REFRESH_RUN).fetchone()
+  return _refresh_run(row)
+
+
+def refresh_candidates(run: RefreshRun, limit: int = 100) -> List[CatalogMovie]:
+  """Return the next catalog entries the run should re-fetch, stalest first."""
+  key, last_id = run["cursor"]
+  with get_engine().connect() as connection:
+    rows = connection.execute(
+      _REFRESH_CANDIDATES,
+      {"cutoff": run["cutoff"], "key": key, "id": last_id, "limit": limit},
+    ).fetchall()
+  return [
+    {
+      "id": int(row[0]),
+      "imdb_id": str(row[1]) if row[1] is not None else None,
+      "title": str(row[2]),
+      "year": int(row[3]),
+      "rating": float(row[4]),
+      "poster": str(row[5]),
+      "refreshed_at": float(row[6]) if row[6] is not None else None,
+    }
+    for row in rows
+  ]
+
+
+def save_refresh_batch(
+  run: RefreshRun,
+  results: List[CatalogRefresh],
+  cursor: PageCursor,
+  failed: int = 0,
+) -> int:
+  """Write one batch of refreshed entries and the run checkpoint in one transaction.
+
+  An entry without IMDb id that OMDb resolves to a film already in the
+  catalog is merged into that entry. Returns how many films changed; `run`
+  is updated in place.
+  """
+  now = time.time()
+  ids = [result["id"] for result in results]
+  changed: set[int] = set()
+  stale_users: List[int] = []
+
+  with _write_transaction() as connection:
+    before: Dict[int, Tuple[Any, ...]] = {}
+    if ids:
+      for row in connection.execute(_CATALOG_BY_IDS, {"ids": ids}):
+        before[int(row[0])] = tuple(row[1:])
+    claimed: Dict[str, int] = {}
+    new_imdb_ids = sorted({
+      result["imdb_id"] for result in results
+      if result["imdb_id"] and result["id"] in before and before[result["id"]][0] is None
+    })
+    if new_imdb_ids:
+      for row in connection.execute(_CATALOG_BY_IMDB_IDS, {"imdb_ids": new_imdb_ids}):
+        claimed[str(row[1])] = int(row[0])
+
+    touched: List[Dict[str, Any]] = []
+    refreshed: Dict[int, Dict[str, Any]] = {}
+    for result in results:
+      old = before.get(result["id"])
+      if old is None:          # deleted meanwhile
+        continue
+      if result["rating"] is None:
+        touched.append({"id": result["id"], "refreshed_at": now})
+        continue
+
+      target = result["id"]
+      imdb_id = result["imdb_id"] or None
+      if old[0] is None and imdb_id is not None:
+        owner = claimed.setdefault(imdb_id, result["id"])
+        if owner != result["id"]:
+          connection.execute(_MERGE_CATALOG_MOVIES, {"from_id": result["id"], "into_id": owner})
+          connection.execute(_DELETE_CATALOG, {"id": result["id"]})
+          target = owner
+          changed.add(owner)
+      if (old[1], old[2]) != (result["rating"], result["poster"]):
+        changed.add(target)
+      refreshed[target] = {
+        "id": target,
+        "imdb_id": imdb_id,
+        "rating": float(result["rating"]),
+        "poster": result["poster"],
+        "refreshed_at": now,
+      }
+
+    if touched:
+      connection.execute(_TOUCH_CATALOG, touched)
+    if refreshed:
+      connection.execute(_REFRESH_CATALOG, list(refreshed.values()))
+    stale_users = _catalog_users(connection, sorted(changed))
+    connection.execute(_CHECKPOINT_REFRESH_RUN, {
+      "id": run["id"],
+      "last_key": cursor[0],
+      "last_id": cursor[1],
+      "processed": len(results),
+      "updated": len(changed),
+      "failed": failed,
+    })
+
+  for user_id in stale_users:
+    _cache_invalidate(user_id)
+  run["cursor"] = cursor
+  run["processed"] += len(results)
+  run["updated"] += len(changed)
+  run["failed"] += failed
+  return len(changed)
+
+
+def finish_refresh_run(run: RefreshRun) -> None:
+  """Mark the run as done; the next open_refresh_run() starts a new one."""
+  with get_engine().begin() as connection:
+    connection.execute(_FINISH_REFRESH_RUN, {"id": run["id"], "finished_at": time.time()})
+
+
+# ---------- Summary maintenance ----------
+
+_AGGREGATE_STATS = _statement("aggregate_stats", """
+  SELECT user_id, COUNT(*), SUM(rating), MIN(rating), MAX(rating)
+  FROM movies GROUP BY user_id
+""")
+_AGGREGATE_BUCKETS = _statement("aggregate_buckets", f"""
+  SELECT user_id, {_bucket_sql("rating")} AS bucket, COUNT(*)
+  FROM movies GROUP BY user_id, bucket
+""")
+_ALL_USER_STATS = _statement("all_user_stats", """
+  SELECT user_id, movie_count, rating_sum, min_rating, max_rating FROM user_stats
+""")
+_ALL_RATING_BUCKETS = _statement("all_rating_buckets", """
+  SELECT user_id, bucket, movie_count FROM user_rating_buckets WHERE movie_count != 0
+""")
+_CLEAR_USER_STATS = _statement("clear_user_stats", "DELETE FROM user_stats")
+_CLEAR_RATING_BUCKETS = _statement("clear_rating_buckets", "DELETE FROM user_rating_buckets")
+_REBUILD_USER_STATS = _statement("rebuild_user_stats", """
+  INSERT INTO user_stats (user_id, movie_count, rating_sum, min_rating, max_rating)
+  SELECT user_id, COUNT(*), SUM(rating), MIN(rating), MAX(rating)
+  FROM movies GROUP BY user_id
+""")
+_REBUILD_RATING_BUCKETS = _statement("rebuild_rating_buckets", f"""
+  INSERT INTO user_rating_buckets (user_id, bucket, movie_count)
+  SELECT user_id, {_bucket_sql("rating")} AS bucket, COUNT(*)
+  FROM movies GROUP BY user_id, bucket
+""")
+_CLEAR_USER_STATS_FOR = _statement(
+  "clear_user_stats_for",
+  "DELETE FROM user_stats WHERE user_id = :user_id",
+)
+_CLEAR_RATING_BUCKETS_FOR = _statement(
+  "clear_rating_buckets_for",
+  "DELETE FROM user_rating_buckets WHERE user_id = :user_id",
+)
+_REBUILD_USER_STATS_FOR = _statement("rebuild_user_stats_for", """
+  INSERT INTO user_stats (user_id, movie_count, rating_sum, min_rating, max_rating)
+  SELECT user_id, COUNT(*), SUM(rating), MIN(rating), MAX(rating)
+  FROM movies WHERE user_id = :user_id GROUP BY user_id
+""")
+_REBUILD_RATING_BUCKETS_FOR = _statement("rebuild_rating_buckets_for", f"""
+  INSERT INTO user_rating_buckets (user_id, bucket, movie_count)
+  SELECT user_id, {_bucket_sql("rating")} AS bucket, COUNT(*)
+  FROM movies WHERE user_id = :user_id GROUP BY user_id, bucket
+""")
+
+# Tolerance for rating_sum, which picks up float rounding over many updates.
+_STATS_SUM_TOLERANCE = 1e-6
+
+
+def check_user_stats() -> List[int]:
+  """Compare the summary tables with the movies table; return stale user ids.
+
+  This aggregates the whole movies table and is meant for maintenance runs.
+  """
+  with get_engine().connect() as connection:
+    expected = {int(row[0]): tuple(row[1:]) for row in connection.execute(_AGGREGATE_STATS)}
+    stored = {
+      int(row[0]): tuple(row[1:])
+      for row in connection.execute(_ALL_USER_STATS)
+      if row[1]
+    }
+    expected_buckets = {
+      (int(row[0]), int(row[1])): int(row[2]) for row in connection.execute(_AGGREGATE_BUCKETS)
+    }
+    stored_buckets = {
+      (int(row[0]), int(row[1])): int(row[2]) for row in connection.execute(_ALL_RATING_BUCKETS)
+    }
+
+  stale: set[int] = set()
+  for user_id in expected.keys() | stored.keys():
+    want, have = expected.get(user_id), stored.get(user_id)
+    if (
+      want is None
+      or have is None
+      or want[0] != have[0]
+      or abs(want[1] - have[1]) > _STATS_SUM_TOLERANCE
+      or want[2:] != have[2:]
+    ):
+      stale.add(user_id)
+  for key in expected_buckets.keys() | stored_buckets.keys():
+    if expected_buckets.get(key) != stored_buckets.get(key):
+      stale.add(key[0])
+  return sorted(stale)
+
+
+def rebuild_user_stats(user_id: Optional[int] = None) -> None:
+  """Recompute the summary tables from movies, for one user or for everyone."""
+  with get_engine().begin() as connection:
+    if user_id is None:
+      connection.execute(_CLEAR_USER_STATS)
+      connection.execute(_CLEAR_RATING_BUCKETS)
+      connection.execute(_REBUILD_USER_STATS)
+      connection.execute(_REBUILD_RATING_BUCKETS)
+    else:
+      params = {"user_id": user_id}
+      connection.execute(_CLEAR_USER_STATS_FOR, params)
+      connection.execute(_CLEAR_RATING_BUCKETS_FOR, params)
+      connection.execute(_REBUILD_USER_STATS_FOR, params)
+      connection.execute(_REBUILD_RATING_BUCKETS_FOR, params)
+
+
+# ---------- Diagnostics ----------
+
+# Statements that read a whole table on purpose: maintenance aggregates,
+# listings of all users, the small refresh-run table, and last_catalog_ids,
+# which walks the rowid backwards and stops after LIMIT rows.
+_FULL_SCAN_ALLOWED = frozenset({
+  "list_users",
+  "all_user_revisions",
+  "all_movie_counts",
+  "last_catalog_ids",
+  "open_refresh_run",
+  "aggregate_stats",
+  "aggregate_buckets",
+  "all_user_stats",
+  "all_rating_buckets",
+  "clear_user_stats",
+  "clear_rating_buckets",
+  "rebuild_user_stats",
+  "rebuild_rating_buckets",
+})
+
+
+def explain_queries() -> Dict[str, List[str]]:
+  """Return the EXPLAIN QUERY PLAN details of every statement, by name.
+
+  A detail line like "SCAN movies" (without an index) means a full table scan.
+  """
+  plans: Dict[str, List[str]] = {}
+  with get_engine().connect() as connection:
+    for name, (sql, expanding) in _STATEMENTS.items():
+      params = {
+        param: [None] if param in expanding else None
+        for param in _PARAM_PATTERN.findall(sql)
+      }
+      clause = text(f"EXPLAIN QUERY PLAN {sql}")
+      if expanding:
+        clause = clause.bindparams(*(bindparam(param, expanding=True) for param in expanding))
+      rows = connection.execute(clause, params).fetchall()
+      plans[name] = [str(row[3]) for row in rows]
+    connection.rollback()
+  return plans
+
+
+def full_scans() -> Dict[str, List[str]]:
+  """Return the scan lines of statements that read a whole table, by name.
+
+  "SCAN t" and "SCAN t USING [COVERING] INDEX i" both visit every row;
+  FTS5 lookups ("SCAN ... VIRTUAL TABLE") and allowed statements are left out.
+  """
+  scans: Dict[str, List[str]] = {}
+  for name, plan in explain_queries().items():
+    if name in _FULL_SCAN_ALLOWED:
+      continue
+    lines = [line for line in plan if line.startswith("SCAN ") and "VIRTUAL TABLE" not in line]
+    if lines:
+      scans[name] = lines
+  return scans
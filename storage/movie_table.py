@@ -0,0 +1,174 @@
+"""
+storage/movie_table.py - Compact, array-backed MovieData container.
+
+A plain MovieData dict keeps one dict per movie (year, rating, poster), which
+costs a few hundred bytes per entry. MovieTable stores the same data column
+by column instead:
+
+- titles:  list[str], sorted (lookups use binary search, no hash table)
+- years:   array('i')  (int32, YEAR_MIN..YEAR_MAX; storage rejects other years)
+- ratings: array('d')  (float64, so records equal what SQLite stores)
+- posters: array('I') of ids into an interned poster table
+
+It implements the read-only Mapping interface, so code written against
+MovieData (generate_website, the CLI) works unchanged.
+Records are built on access and are plain dicts.
+"""
+
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left
+from collections.abc import ItemsView, ValuesView
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Mapping, Tuple
+
+if TYPE_CHECKING:
+  from storage.movie_storage_sql import MovieRecord
+
+# Range of the year column; the storage refuses years outside of it.
+YEAR_MIN = -(2 ** 31)
+YEAR_MAX = 2 ** 31 - 1
+
+
+class _Items(ItemsView):
+  def __iter__(self) -> Iterator[Tuple[str, MovieRecord]]:
+    return self._mapping.iter_items()
+
+
+class _Values(ValuesView):
+  def __iter__(self) -> Iterator[MovieRecord]:
+    return (record for _, record in self._mapping.iter_items())
+
+
+class MovieTable(Mapping[str, "MovieRecord"]):
+  """Columnar, read-only mapping title -> MovieRecord, iterated in title order."""
+
+  __slots__ = ("_titles", "_years", "_ratings", "_poster_ids", "_posters")
+
+  def __init__(self, items: Iterable[Tuple[str, MovieRecord]] = ()) -> None:
+    self._titles: List[str] = []
+    self._years = array("i")
+    self._ratings = array("d")
+    self._poster_ids = array("I")
+    self._posters: List[str] = [""]
+
+    poster_ids: Dict[str, int] = {"": 0}
+    in_order = True
+    for title, record in items:
+      if self._titles and title <= self._titles[-1]:
+        in_order = False
+      poster = str(record.get("poster", ""))
+      poster_id = poster_ids.get(poster)
+      if poster_id is None:
+        poster_id = poster_ids[poster] = len(self._posters)
+        self._posters.append(poster)
+      self._titles.append(title)
+      self._years.append(int(record["year"]))
+      self._ratings.append(float(record["rating"]))
+      self._poster_ids.append(poster_id)
+
+    if not in_order:
+      self._sort()
+
+  def _sort(self) -> None:
+    """Sort all columns by title, keeping the last record of duplicate titles."""
+    order = sorted(range(len(self._titles)), key=self._titles.__getitem__)
+    positions: Dict[str, int] = {}
+    for position in order:
+      positions[self._titles[position]] = position
+    keep = list(positions.values())
+    self._titles = [self._titles[i] for i in keep]
+    self._years = array("i", (self._years[i] for i in keep))
+    self._ratings = array("d", (self._ratings[i] for i in keep))
+    self._poster_ids = array("I", (self._poster_ids[i] for i in keep))
+
+  def _position(self, title: str) -> int:
+    position = bisect_left(self._titles, title)
+    if position < len(self._titles) and self._titles[position] == title:
+      return position
+    return -1
+
+  def _record(self, position: int) -> MovieRecord:
+    return {
+      "year": self._years[position],
+      "rating": self._ratings[position],
+      "poster": self._posters[self._poster_ids[position]],
+    }
+
+  def __getitem__(self, title: str) -> MovieRecord:
+    position = self._position(title) if isinstance(title, str) else -1
+    if position < 0:
+      raise KeyError(title)
+    return self._record(position)
+
+  def __contains__(self, title: object) -> bool:
+    return isinstance(title, str) and self._position(title) >= 0
+
+  def __iter__(self) -> Iterator[str]:
+    return iter(self._titles)
+
+  def __len__(self) -> int:
+    return len(self._titles)
+
+  def __repr__(self) -> str:
+    return f"MovieTable({len(self)} movies)"
+
+  def iter_items(self) -> Iterator[Tuple[str, MovieRecord]]:
+    """Iterate (title, record) pairs without a lookup per title."""
+    for position, title in enumerate(self._titles):
+      yield title, self._record(position)
+
+  def items(self) -> _Items:  # type: ignore[override]
+    return _Items(self)
+
+  def values(self) -> _Values:  # type: ignore[override]
+    return _Values(self)
+
+  @property
+  def ratings(self) -> array:
+    """The float64 rating column, in title order (shares memory; do not modify)."""
+    return self._ratings
+
+  @property
+  def years(self) -> array:
+    """The int32 year column, in title order (shares memory; do not modify)."""
+    return self._years
+
+  # The two methods below let the storage cache patch a cached table after a
+  # write. They are O(n) memmoves; the Mapping interface stays read-only.
+
+  def put(self, title: str, record: MovieRecord) -> None:
+    """Insert or replace one movie."""
+    poster = str(record.get("poster", ""))
+    if not poster:
+      poster_id = 0
+    elif poster == self._posters[-1]:
+      poster_id = len(self._posters) - 1
+    else:
+      poster_id = len(self._posters)
+      self._posters.append(poster)
+
+    position = bisect_left(self._titles, title)
+    if position < len(self._titles) and self._titles[position] == title:
+      self._years[position] = int(record["year"])
+      self._ratings[position] = float(record["rating"])
+      self._poster_ids[position] = poster_id
+      return
+    self._titles.insert(position, title)
+    self._years.insert(position, int(record["year"]))
+    self._ratings.insert(position, float(record["rating"]))
+    self._poster_ids.insert(position, poster_id)
+
+  def remove(self, title: str) -> bool:
+    """Remove one movie; returns False if it was not there.
+
+    Its poster stays in the poster table until the table is rebuilt.
+    """
+    position = self._position(title)
+    if position < 0:
+      return False
+    del self._titles[position]
+    del self._years[position]
+    del self._ratings[position]
+    del self._poster_ids[position]
+    return True
@@ -0,0 +1,205 @@
+"""
+storage/omdb_cache.py - Persistent SQLite cache for OMDb responses.
+
+Raw OMDb JSON responses are stored under a key built from the normalised
+title ("t:inception") or the IMDb id ("i:tt1375666"), so a movie looked up
+once is served from disk for every user, session and process.
+
+- entries expire after `ttl` seconds; "not found" answers after `negative_ttl`
+- at most `max_entries` rows are kept; the least recently used go first
+- the database runs in WAL mode with a busy timeout (see make_engine) and
+  every transaction begins IMMEDIATE, so several processes can share one
+  cache file without losing hits to "database is locked"
+- database errors never reach the caller: get() then reports a miss and
+  put() drops the entry, so a broken cache only costs network calls
+- an in-memory cache ("sqlite://") has a single shared connection, so its
+  calls are serialised with a lock
+
+Public API:
+- ResponseCache(url=None, ttl=..., negative_ttl=..., max_entries=...)
+- title_key(title, year=None) / imdb_key(imdb_id)
+- get_cache() -> ResponseCache (shared, URL from $OMDB_CACHE_URL or CACHE_URL)
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, ContextManager, Dict, Iterator, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import SQLAlchemyError
+
+from storage.movie_storage_sql import is_memory_url, make_engine
+
+CACHE_URL = "sqlite:///data/omdb_cache.db"
+CACHE_URL_ENV = "OMDB_CACHE_URL"
+
+DEFAULT_TTL = 30 * 24 * 3600          # 30 days
+DEFAULT_NEGATIVE_TTL = 24 * 3600      # 1 day for "Film nicht gefunden"
+DEFAULT_MAX_ENTRIES = 100_000
+
+# Eviction needs a COUNT(*); run it only every this many writes.
+_EVICT_EVERY = 100
+
+
+def normalize_title(title: str) -> str:
+  """Case- and whitespace-insensitive form of a title."""
+  return " ".join(title.split()).casefold()
+
+
+def title_key(title: str, year: Optional[int] = None) -> str:
+  key = f"t:{normalize_title(title)}"
+  return key if year is None else f"{key}:{year}"
+
+
+def imdb_key(imdb_id: str) -> str:
+  return f"i:{imdb_id.strip().lower()}"
+
+
+class ResponseCache:
+  """TTL + LRU cache of OMDb JSON responses in SQLite."""
+
+  def __init__(
+    self,
+    url: Optional[str] = None,
+    ttl: float = DEFAULT_TTL,
+    negative_ttl: float = DEFAULT_NEGATIVE_TTL,
+    max_entries: int = DEFAULT_MAX_ENTRIES,
+  ) -> None:
+    self.url = url or os.environ.get(CACHE_URL_ENV) or CACHE_URL
+    self.ttl = ttl
+    self.negative_ttl = negative_ttl
+    self.max_entries = max_entries
+    self._engine: Optional[Engine] = None
+    self._lock = threading.Lock()
+    self._serial: ContextManager[Any] = (
+      threading.RLock() if is_memory_url(self.url) else nullcontext()
+    )
+    self._writes = 0
+
+  def _get_engine(self) -> Engine:
+    if self._engine is None:
+      with self._lock:
+        if self._engine is None:
+          engine = make_engine(self.url, pool_size=2)
+          with engine.begin() as connection:
+            connection.execute(text("""
+              CREATE TABLE IF NOT EXISTS omdb_responses (
+                cache_key TEXT PRIMARY KEY,
+                payload TEXT NOT NULL,
+                found INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+              )
+            """))
+            connection.execute(text(
+              "CREATE INDEX IF NOT EXISTS idx_omdb_responses_accessed"
+              " ON omdb_responses (accessed_at)"
+            ))
+          self._engine = engine
+    return self._engine
+
+  @contextmanager
+  def _transaction(self) -> Iterator[Connection]:
+    # get() reads before it writes; a deferred transaction would fail to
+    # upgrade its stale read lock once another process has committed.
+    engine = self._get_engine().execution_options(sqlite_begin="IMMEDIATE")
+    with self._serial, engine.begin() as connection:
+      yield connection
+
+  def get(self, key: str) -> Optional[Dict[str, Any]]:
+    """Return the cached response for `key`, or None if missing or expired."""
+    try:
+      return self._get(key, time.time())
+    except (SQLAlchemyError, OSError):
+      return None
+
+  def _get(self, key: str, now: float) -> Optional[Dict[str, Any]]:
+    with self._transaction() as connection:
+      row = connection.execute(
+        text("SELECT payload, found, fetched_at FROM omdb_responses WHERE cache_key = :key"),
+        {"key": key},
+      ).fetchone()
+      if row is None:
+        return None
+      payload, found, fetched_at = row
+      if now - fetched_at > (self.ttl if found else self.negative_ttl):
+        connection.execute(
+          text("DELETE FROM omdb_responses WHERE cache_key = :key"),
+          {"key": key},
+        )
+        return None
+      connection.execute(
+        text("UPDATE omdb_responses SET accessed_at = :now WHERE cache_key = :key"),
+        {"key": key, "now": now},
+      )
+    return json.loads(payload)
+
+  def put(self, key: str, payload: Dict[str, Any]) -> None:
+    """Store a raw OMDb response (found or not) under `key`."""
+    try:
+      self._put(key, payload, time.time())
+    except (SQLAlchemyError, OSError):
+      return
+
+    with self._lock:
+      self._writes += 1
+      evict = self._writes % _EVICT_EVERY == 0
+    if evict:
+      try:
+        self.evict()
+      except (SQLAlchemyError, OSError):
+        pass
+
+  def _put(self, key: str, payload: Dict[str, Any], now: float) -> None:
+    found = 1 if payload.get("Response") == "True" else 0
+    with self._transaction() as connection:
+      connection.execute(text("""
+        INSERT INTO omdb_responses (cache_key, payload, found, fetched_at, accessed_at)
+        VALUES (:key, :payload, :found, :now, :now)
+        ON CONFLICT(cache_key) DO UPDATE SET
+          payload = excluded.payload,
+          found = excluded.found,
+          fetched_at = excluded.fetched_at,
+          accessed_at = excluded.accessed_at
+      """), {"key": key, "payload": json.dumps(payload), "found": found, "now": now})
+
+  def evict(self) -> int:
+    """Drop the least recently used entries above max_entries; returns how many."""
+    with self._transaction() as connection:
+      result = connection.execute(text("""
+        DELETE FROM omdb_responses WHERE cache_key IN (
+          SELECT cache_key FROM omdb_responses
+          ORDER BY accessed_at
+          LIMIT MAX(0, (SELECT COUNT(*) FROM omdb_responses) - :max_entries)
+        )
+      """), {"max_entries": self.max_entries})
+    return int(result.rowcount)
+
+  def clear(self) -> None:
+    with self._transaction() as connection:
+      connection.execute(text("DELETE FROM omdb_responses"))
+
+  def close(self) -> None:
+    if self._engine is not None:
+      self._engine.dispose()
+      self._engine = None
+
+
+_default_cache: Optional[ResponseCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_cache() -> ResponseCache:
+  """Return the shared ResponseCache, creating it on first use."""
+  global _default_cache  # pylint: disable=global-statement
+  if _default_cache is None:
+    with _default_cache_lock:
+      if _default_cache is None:
+        _default_cache = ResponseCache()
+  return _default_cache
@@ -0,0 +1,239 @@
+"""
+storage/title_index.py - Exact, fast fuzzy title matching for suggestions.
+
+difflib.get_close_matches() runs a SequenceMatcher against every title. Its
+ratio is 2*M / (len(a) + len(b)), where the M matched characters form a
+common subsequence of both strings, so 2*LCS / (len(a) + len(b)) is an upper
+bound of it. TitleIndex keeps, per title and character class, a 64-bit mask
+of the positions holding that class, and computes the LCS of the query with
+all titles at once (bit-parallel, with NumPy, in cache-sized blocks).
+Titles are then scored with SequenceMatcher in order of that bound until
+the bound falls below the n-th best score, which is usually after a few
+dozen titles. The result is exactly get_close_matches(query, titles, n, cutoff).
+
+Characters are folded into CHAR_CLASSES classes (case-insensitive letters,
+digits, space, and hashed buckets for everything else). Folding only adds
+matches, so the bound stays an upper bound. Titles longer than MASK_BITS
+are bounded by their first MASK_BITS characters plus the rest.
+
+Memory is about CHAR_CLASSES * 8 bytes plus the title itself per title
+(see nbytes). Without NumPy close_matches() runs difflib over all titles.
+
+Public API:
+- TitleIndex(titles=()) with add(title), remove(title), close_matches(query,
+  n=5, cutoff=0.6), nbytes, len() and `in`
+"""
+
+from __future__ import annotations
+
+import heapq
+import sys
+from difflib import SequenceMatcher, get_close_matches
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+  import numpy as np
+except ImportError:  # optional dependency
+  np = None
+
+MASK_BITS = 64
+_FOLDED = "abcdefghijklmnopqrstuvwxyz0123456789 "
+_OTHER_CLASSES = 11
+CHAR_CLASSES = len(_FOLDED) + _OTHER_CLASSES
+
+# Titles per block of the bit-parallel pass; keeps the working set in cache.
+_BLOCK = 4096
+# Estimated bytes per title for the slot dict and title list entries.
+_SLOT_OVERHEAD = 120
+_ALL_BITS = (1 << MASK_BITS) - 1
+
+_CLASS_OF = {char: position for position, char in enumerate(_FOLDED)}
+
+
+def _char_class(char: str) -> int:
+  folded = _CLASS_OF.get(char.lower())
+  return folded if folded is not None else len(_FOLDED) + ord(char) % _OTHER_CLASSES
+
+
+def _classes_of(points: Any) -> Any:
+  """Character class of every code point in a uint32 array."""
+  classes = np.empty(len(points), dtype=np.intp)
+  ascii_chars = points < 128
+  classes[ascii_chars] = _ASCII_CLASSES[points[ascii_chars]]
+  others = ~ascii_chars
+  if others.any():
+    unique, inverse = np.unique(points[others], return_inverse=True)
+    unique_classes = [_char_class(chr(point)) for point in unique.tolist()]
+    classes[others] = np.array(unique_classes, dtype=np.intp)[inverse]
+  return classes
+
+
+if np is not None:
+  _ASCII_CLASSES = np.array([_char_class(chr(point)) for point in range(128)], dtype=np.intp)
+
+
+def _popcount(values: Any) -> Any:
+  if hasattr(np, "bitwise_count"):
+    return np.bitwise_count(values).astype(np.int64)
+  table = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.int64)
+  return table[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+class TitleIndex:
+  """Set of titles with difflib-exact close_matches() in a few milliseconds."""
+
+  def __init__(self, titles: Iterable[str] = ()) -> None:
+    self._slots: Dict[str, int] = {}
+    self._titles: List[Optional[str]] = []
+    self._free: List[int] = []
+    self._title_bytes = 0
+    if np is not None:
+      self._masks = np.zeros((CHAR_CLASSES, 0), dtype=np.uint64)
+      self._low_bits = np.zeros(0, dtype=np.uint64)
+      self._lengths = np.zeros(0, dtype=np.int64)     # -1 marks a free slot
+    self._extend(titles)
+
+  def __len__(self) -> int:
+    return len(self._slots)
+
+  def __contains__(self, title: object) -> bool:
+    return title in self._slots
+
+  @property
+  def nbytes(self) -> int:
+    """Approximate memory held by the index."""
+    arrays = 0
+    if np is not None:
+      arrays = self._masks.nbytes + self._low_bits.nbytes + self._lengths.nbytes
+    return arrays + self._title_bytes
+
+  def add(self, title: str) -> None:
+    """Index a title (no-op if it is already indexed)."""
+    self._extend((title,))
+
+  def remove(self, title: str) -> None:
+    """Remove a title from the index (no-op if it is unknown)."""
+    slot = self._slots.pop(title, None)
+    if slot is None:
+      return
+    self._titles[slot] = None
+    self._free.append(slot)
+    self._title_bytes -= sys.getsizeof(title) + _SLOT_OVERHEAD
+    if np is not None:
+      self._masks[:, slot] = 0
+      self._low_bits[slot] = 0
+      self._lengths[slot] = -1
+
+  def _grow(self, capacity: int) -> None:
+    size = self._lengths.shape[0]
+    if capacity <= size:
+      return
+    capacity = max(capacity, 2 * size, 64)
+    masks = np.zeros((CHAR_CLASSES, capacity), dtype=np.uint64)
+    masks[:, :size] = self._masks
+    low_bits = np.zeros(capacity, dtype=np.uint64)
+    low_bits[:size] = self._low_bits
+    lengths = np.full(capacity, -1, dtype=np.int64)
+    lengths[:size] = self._lengths
+    self._masks, self._low_bits, self._lengths = masks, low_bits, lengths
+
+  def _extend(self, titles: Iterable[str]) -> None:
+    added: List[Tuple[int, str]] = []
+    for title in titles:
+      if title in self._slots:
+        continue
+      if self._free:
+        slot = self._free.pop()
+      else:
+        slot = len(self._titles)
+        self._titles.append(None)
+      self._titles[slot] = title
+      self._slots[title] = slot
+      self._title_bytes += sys.getsizeof(title) + _SLOT_OVERHEAD
+      added.append((slot, title))
+    if np is None or not added:
+      return
+
+    self._grow(len(self._titles))
+    slots = np.array([slot for slot, _ in added], dtype=np.intp)
+    lengths = np.array([len(title) for _, title in added], dtype=np.int64)
+    heads = "".join(title[:MASK_BITS] for _, title in added)
+    points = np.frombuffer(heads.encode("utf-32-le", "surrogatepass"), dtype=np.uint32)
+    sizes = np.minimum(lengths, MASK_BITS)
+    positions = np.arange(len(points)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    np.bitwise_or.at(
+      self._masks,
+      (_classes_of(points), np.repeat(slots, sizes)),
+      np.left_shift(np.uint64(1), positions.astype(np.uint64)),
+    )
+    self._lengths[slots] = lengths
+    self._low_bits[slots] = np.where(
+      sizes >= MASK_BITS,
+      np.uint64(_ALL_BITS),
+      np.left_shift(np.uint64(1), sizes.astype(np.uint64)) - np.uint64(1),
+    )
+
+  def _lcs_bounds(self, query: str, count: int) -> Any:
+    """Upper bounds of LCS(title, query) for slots [0, count)."""
+    rows = [self._masks[_char_class(char)] for char in query]
+    state = np.empty(count, dtype=np.uint64)
+    matched = np.empty(min(count, _BLOCK), dtype=np.uint64)
+    unmatched = np.empty_like(matched)
+    for start in range(0, count, _BLOCK):
+      stop = min(start + _BLOCK, count)
+      block = state[start:stop]
+      block.fill(_ALL_BITS)
+      hits = matched[:stop - start]
+      rest = unmatched[:stop - start]
+      # Allison-Dix / Hyyrö: V = (V + (V & M)) | (V & ~M), one query char at a time.
+      for row in rows:
+        np.bitwise_and(block, row[start:stop], out=hits)
+        np.subtract(block, hits, out=rest)
+        np.add(block, hits, out=block)
+        np.bitwise_or(block, rest, out=block)
+
+    # Zero bits below the title length count the LCS of the first MASK_BITS chars.
+    lcs = _popcount(~state & self._low_bits[:count])
+    lengths = self._lengths[:count]
+    beyond = np.maximum(lengths - MASK_BITS, 0)
+    return np.minimum(lcs + beyond, len(query))
+
+  def close_matches(self, query: str, n: int = 5, cutoff: float = 0.6) -> List[str]:
+    """Same result as difflib.get_close_matches(query, titles, n, cutoff)."""
+    if n <= 0:
+      raise ValueError(f"n must be > 0: {n!r}")
+    if not 0.0 <= cutoff <= 1.0:
+      raise ValueError(f"cutoff must be in [0.0, 1.0]: {cutoff!r}")
+    if np is None:
+      return get_close_matches(query, self._slots, n, cutoff)
+
+    count = len(self._titles)
+    if count == 0:
+      return []
+    lengths = self._lengths[:count]
+    totals = lengths + len(query)
+    bounds = np.where(
+      totals > 0,
+      2.0 * self._lcs_bounds(query, count) / np.maximum(totals, 1),
+      1.0,
+    )
+    candidates = np.flatnonzero((bounds >= cutoff) & (lengths >= 0))
+    order = candidates[np.argsort(-bounds[candidates], kind="stable")]
+
+    best: List[Tuple[float, str]] = []     # min-heap of the n best (score, title)
+    matcher = SequenceMatcher()
+    matcher.set_seq2(query)
+    for slot, bound in zip(order.tolist(), bounds[order].tolist()):
+      if len(best) == n and bound < best[0][0]:
+        break
+      title = self._titles[slot]
+      assert title is not None
+      matcher.set_seq1(title)
+      score = matcher.ratio()
+      if score < cutoff:
+        continue
+      if len(best) < n:
+        heapq.heappush(best, (score, title))
+      elif (score, title) > best[0]:
+        heapq.heapreplace(best, (score, title))
+    return [title for _, title in sorted(best, reverse=True)]
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from typing import Iterator, List, Optional, Set
+
+import pytest
+from sqlalchemy import text
+
+import catalog_refresh
+import movie_api
+from rate_limit import Backoff
+from storage import movie_storage_sql as storage
+
+IMDB_IDS = [f"tt{number:07d}" for number in range(1, 7)]
+
+
+class FakeClient(movie_api.OmdbClient):
+  """Answers fetch_by_id() locally; ids in `blocked` raise CircuitOpenError."""
+
+  def __init__(self, retries: int = 0) -> None:
+    super().__init__(backoff=Backoff(retries=retries))
+    self.fetched: List[str] = []
+    self.blocked: Set[str] = set()
+
+  def fetch_by_id(self, imdb_id: str, refresh: bool = False) -> movie_api.FetchedMovie:
+    if imdb_id in self.blocked:
+      raise movie_api.CircuitOpenError("gesperrt")
+    self.requests_sent += self.backoff.retries + 1     # worst case: every retry used
+    self.fetched.append(imdb_id)
+    return {"title": imdb_id, "year": 2000, "rating": 9.0, "poster": "", "imdb_id": imdb_id}
+
+
+@pytest.fixture
+def catalog() -> Iterator[int]:
+  storage.configure("sqlite://")
+  user = storage.create_user("alice")
+  for imdb_id in IMDB_IDS:
+    storage.add_movie(user, imdb_id, 2000, 5.0, "", imdb_id=imdb_id)
+  with storage.get_engine().begin() as connection:
+    connection.execute(text("UPDATE catalog SET refreshed_at = id"))
+  yield user
+  storage.configure()
+
+
+def _refresh(client: FakeClient, budget: int, batch_size: int = 10) -> catalog_refresh.RefreshReport:
+  return catalog_refresh.refresh_catalog(
+    max_age_days=1, budget=budget, concurrency=2, batch_size=batch_size, client=client,
+  )
+
+
+def test_budget_counts_http_requests_and_run_resumes(catalog: int) -> None:
+  client = FakeClient(retries=2)
+  first = _refresh(client, budget=7)
+  assert (first["requests"], first["processed"], first["finished"]) == (6, 2, False)
+
+  second = _refresh(client, budget=100, batch_size=3)
+  assert second["run_id"] == first["run_id"]
+  assert (second["processed"], second["updated"], second["finished"]) == (6, 6, True)
+  assert client.fetched == IMDB_IDS
+  assert storage.get_movies(catalog)[IMDB_IDS[0]]["rating"] == 9.0
+
+
+def test_blocked_lookup_keeps_checkpoint_and_results_after_it(catalog: int) -> None:
+  client = FakeClient()
+  client.blocked = {IMDB_IDS[1]}
+  report = _refresh(client, budget=100)
+  assert (report["processed"], report["finished"]) == (5, False)
+
+  client.blocked = set()
+  report = _refresh(client, budget=100)
+  assert (report["processed"], report["finished"]) == (6, True)
+  assert sorted(client.fetched) == sorted(IMDB_IDS)      # nothing fetched twice
+
+
+@pytest.mark.parametrize(
+  "options",
+  [{"max_age_days": -1}, {"budget": -1}, {"concurrency": 0}, {"batch_size": 0}],
+)
+def test_rejects_invalid_options(catalog: int, options: dict) -> None:
+  with pytest.raises(ValueError):
+    catalog_refresh.refresh_catalog(client=FakeClient(), **options)
+
+
+def test_title_lookup_requires_same_year() -> None:
+  class TitleClient(FakeClient):
+    def fetch(
+      self, title: str, refresh: bool = False, year: Optional[int] = None,
+    ) -> movie_api.FetchedMovie:
+      return {"title": "Heat", "year": 1995, "rating": 8.3, "poster": "", "imdb_id": "tt0113277"}
+
+  legacy: storage.CatalogMovie = {
+    "id": 1, "imdb_id": None, "title": "Heat", "year": 1986, "rating": 5.0, "poster": "x",
+    "refreshed_at": None,
+  }
+  assert catalog_refresh._lookup(TitleClient(), legacy) == (None, None)  # pylint: disable=protected-access
+  fetched, _ = catalog_refresh._lookup(TitleClient(), {**legacy, "year": 1995})  # pylint: disable=protected-access
+  assert fetched is not None and fetched["imdb_id"] == "tt0113277"
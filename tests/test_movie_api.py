@@ -0,0 +1,133 @@
+from __future__ import annotations
+
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import pytest
+
+import movie_api
+from rate_limit import Backoff, CircuitBreaker, TokenBucket
+
+HEAT = {
+  "Response": "True", "Title": "Heat", "Year": "1995", "imdbRating": "8.3",
+  "Poster": "N/A", "imdbID": "tt0113277",
+}
+
+# (status, headers, body) per request; the last one repeats.
+Reply = Tuple[int, Dict[str, str], object]
+
+
+class StubOmdb:
+  """A local HTTP server that answers with scripted replies and records queries."""
+
+  def __init__(self) -> None:
+    self.replies: List[Reply] = [(200, {}, HEAT)]
+    self.queries: List[str] = []
+    stub = self
+
+    class Handler(BaseHTTPRequestHandler):
+      def do_GET(self) -> None:  # pylint: disable=invalid-name
+        stub.queries.append(self.path)
+        status, headers, body = stub.replies.pop(0) if len(stub.replies) > 1 else stub.replies[0]
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        for name, value in {"Content-Type": "application/json", **headers}.items():
+          self.send_header(name, value)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+      def log_message(self, *args: object) -> None:
+        pass
+
+    self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+    self._thread = threading.Thread(target=self.server.serve_forever, args=(0.01,), daemon=True)
+    self._thread.start()
+
+  def close(self) -> None:
+    self.server.shutdown()
+    self.server.server_close()
+
+
+class FakeClock:
+  def __init__(self) -> None:
+    self.now = 0.0
+
+  def __call__(self) -> float:
+    return self.now
+
+
+class RecordingBackoff(Backoff):
+  def __init__(self, retries: int = 3) -> None:
+    super().__init__(retries=retries, base=0.001, max_delay=0.01)
+    self.retry_afters: List[Optional[float]] = []
+
+  def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+    self.retry_afters.append(retry_after)
+    return super().delay(attempt, retry_after)
+
+
+@pytest.fixture
+def stub() -> Iterator[StubOmdb]:
+  server = StubOmdb()
+  yield server
+  server.close()
+
+
+def _client(
+  stub: StubOmdb,
+  breaker: Optional[CircuitBreaker] = None,
+  backoff: Optional[Backoff] = None,
+) -> movie_api.OmdbClient:
+  return movie_api.OmdbClient(
+    base_url=stub.url,
+    timeout=5,
+    rate_limiter=TokenBucket(1000.0, 1000),
+    breaker=breaker or CircuitBreaker(),
+    backoff=backoff or RecordingBackoff(),
+  )
+
+
+def test_fetch_parses_response(stub: StubOmdb) -> None:
+  with _client(stub) as client:
+    movie = client.fetch("heat", year=1995)
+  assert movie == {"title": "Heat", "year": 1995, "rating": 8.3, "poster": "", "imdb_id": "tt0113277"}
+  assert "t=heat" in stub.queries[0] and "y=1995" in stub.queries[0]
+
+
+def test_retries_5xx_and_429_with_retry_after(stub: StubOmdb) -> None:
+  stub.replies = [(503, {}, {}), (429, {"Retry-After": "0"}, {}), (200, {}, HEAT)]
+  backoff = RecordingBackoff()
+  with _client(stub, backoff=backoff) as client:
+    assert client.fetch("Heat")["imdb_id"] == "tt0113277"
+  assert len(stub.queries) == 3
+  assert backoff.retry_afters == [None, 0.0]
+
+
+def test_gives_up_after_retries(stub: StubOmdb) -> None:
+  stub.replies = [(500, {}, {})]
+  with _client(stub, backoff=RecordingBackoff(retries=2)) as client:
+    with pytest.raises(movie_api.ApiConnectionError):
+      client.fetch("Heat")
+  assert len(stub.queries) == 3
+
+
+def test_open_breaker_blocks_requests_until_half_open_trial(stub: StubOmdb) -> None:
+  clock = FakeClock()
+  breaker = CircuitBreaker(failure_threshold=1, reset_timeout=30.0, clock=clock)
+  stub.replies = [(503, {}, {}), (503, {}, {}), (200, {}, HEAT)]
+  with _client(stub, breaker=breaker, backoff=RecordingBackoff(retries=1)) as client:
+    with pytest.raises(movie_api.ApiConnectionError):
+      client.fetch("Heat")
+    assert breaker.state == "open"
+    with pytest.raises(movie_api.CircuitOpenError):
+      client.fetch("Heat")
+    assert len(stub.queries) == 2       # no request while open
+
+    clock.now += 30
+    assert client.fetch("Heat")["title"] == "Heat"
+  assert breaker.state == "closed"
+  assert len(stub.queries) == 3
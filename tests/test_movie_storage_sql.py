@@ -0,0 +1,270 @@
+from __future__ import annotations
+
+import subprocess
+import sys
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from storage import movie_storage_sql as storage
+
+
+@pytest.fixture
+def memory_db() -> Iterator[None]:
+  storage.configure("sqlite://")
+  yield
+  storage.configure()
+
+
+def test_no_unexpected_full_scans(memory_db: None) -> None:
+  assert storage.full_scans() == {}
+
+
+def test_failed_migration_rolls_back(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+  url = f"sqlite:///{tmp_path / 'movies.db'}"
+  storage.configure(url)
+  storage.create_user("alice")
+  version = len(storage._MIGRATIONS)  # pylint: disable=protected-access
+
+  broken = (
+    "CREATE TABLE probe (x INTEGER)",
+    "ALTER TABLE movies ADD COLUMN probe INTEGER",
+    "SELECT * FROM missing_table",
+  )
+  monkeypatch.setattr(storage, "_MIGRATIONS", [*storage._MIGRATIONS, broken])  # pylint: disable=protected-access
+  storage.configure(url)
+  with pytest.raises(OperationalError):
+    storage.get_engine()
+
+  engine = storage.make_engine(url)
+  try:
+    with engine.connect() as connection:
+      assert connection.execute(text("PRAGMA user_version")).scalar() == version
+      tables = {row[0] for row in connection.execute(text("SELECT name FROM sqlite_master"))}
+      columns = {row[1] for row in connection.execute(text("PRAGMA table_info(movies)"))}
+  finally:
+    engine.dispose()
+  assert "probe" not in tables
+  assert "probe" not in columns
+
+  monkeypatch.undo()
+  storage.configure(url)
+  assert storage.list_users()[0][1] == "alice"
+  storage.configure()
+
+
+def test_add_movie_keeps_existing_catalog_row(memory_db: None) -> None:
+  alice = storage.create_user("alice")
+  bob = storage.create_user("bob")
+  storage.add_movie(alice, "Inception", 2010, 8.0, "old.jpg", imdb_id="tt1375666")
+  with storage.get_engine().begin() as connection:
+    connection.execute(text("UPDATE catalog SET rating = 9.0, poster = 'new.jpg'"))
+
+  storage.add_movie(bob, "Inception", 2010, 8.0, "old.jpg", imdb_id="tt1375666")
+  catalog = storage.get_catalog_movie("tt1375666")
+  assert catalog is not None
+  assert (catalog["rating"], catalog["poster"]) == (9.0, "new.jpg")
+  assert storage.get_movies(bob)["Inception"]["rating"] == 9.0
+
+
+def test_get_movies_reloads_after_outside_change(tmp_path: Path) -> None:
+  url = f"sqlite:///{tmp_path / 'movies.db'}"
+  storage.configure(url)
+  user = storage.create_user("alice")
+  storage.add_movie(user, "Heat", 1995, 8.3, "")
+  assert storage.get_movies(user)["Heat"]["rating"] == 8.3
+
+  storage.add_movie(user, "Alien", 1979, 8.5, "")
+  hits = storage.cache_info()["hits"]
+  assert "Alien" in storage.get_movies(user)
+  assert storage.cache_info()["hits"] == hits + 1
+
+  other = storage.make_engine(url)     # e.g. another process
+  try:
+    with other.begin() as connection:
+      connection.execute(text("UPDATE movies SET rating = 3.0 WHERE title = 'Heat'"))
+  finally:
+    other.dispose()
+  assert storage.get_movies(user)["Heat"]["rating"] == 3.0
+  storage.configure()
+
+
+def test_import_does_not_load_numpy() -> None:
+  code = "import sys, storage.movie_storage_sql; print('numpy' in sys.modules)"
+  output = subprocess.run(
+    [sys.executable, "-c", code], check=True, capture_output=True, text=True,
+    cwd=Path(__file__).resolve().parents[1],
+  ).stdout
+  assert output.strip() == "False"
+
+
+def test_suggest_titles_sees_outside_change(tmp_path: Path) -> None:
+  url = f"sqlite:///{tmp_path / 'movies.db'}"
+  storage.configure(url)
+  user = storage.create_user("alice")
+  storage.add_movie(user, "Heat", 1995, 8.3, "")
+  assert storage.suggest_titles(user, "Heet") == ["Heat"]
+
+  other = storage.make_engine(url)     # e.g. another process
+  try:
+    with other.begin() as connection:
+      connection.execute(text("UPDATE movies SET title = 'Alien' WHERE title = 'Heat'"))
+  finally:
+    other.dispose()
+  assert storage.suggest_titles(user, "Alin") == ["Alien"]
+  storage.configure()
+
+
+def test_bulk_insert_reports_conflicts(memory_db: None) -> None:
+  user = storage.create_user("alice")
+  storage.add_movie(user, "Heat", 1995, 8.3, "")
+  records = (
+    {"title": title, "year": 2000, "rating": 7.0, "poster": ""}
+    for title in ["Alien", "Heat", "Alien", "Up"]
+  )
+  result = storage.add_movies_bulk(user, records, batch_size=2)
+  assert result == {"inserted": 2, "skipped": 2, "conflicts": ["Heat", "Alien"]}
+  assert sorted(storage.get_movies(user)) == ["Alien", "Heat", "Up"]
+  with pytest.raises(ValueError):
+    storage.add_movies_bulk(user, [], batch_size=0)
+
+
+def test_user_stats_follow_writes_and_rebuild(memory_db: None) -> None:
+  user = storage.create_user("alice")
+  for title, rating in [("Alien", 8.5), ("Heat", 8.3), ("Up", 6.0)]:
+    storage.add_movie(user, title, 2000, rating, "")
+  storage.update_movie(user, "Up", 9.0)
+  storage.delete_movie(user, "Heat")
+  stats = storage.rating_stats(user)
+  assert stats is not None
+  assert (stats["count"], stats["min"], stats["max"]) == (2, 8.5, 9.0)
+  assert storage.rating_histogram(user)[8:10] == [1, 1]
+  assert storage.check_user_stats() == []
+
+  with storage.get_engine().begin() as connection:
+    connection.execute(text("UPDATE user_stats SET movie_count = 7"))
+    connection.execute(text("DELETE FROM user_rating_buckets"))
+  assert storage.check_user_stats() == [user]
+  storage.rebuild_user_stats(user)
+  assert storage.check_user_stats() == []
+  assert storage.count_movies(user) == 2
+
+
+def test_random_movie_slots_stay_dense_after_deletes(memory_db: None) -> None:
+  user = storage.create_user("alice")
+  titles = [f"Film {number}" for number in range(20)]
+  for title in titles:
+    storage.add_movie(user, title, 2000, 5.0, "")
+  for title in titles[::3]:
+    storage.delete_movie(user, title)
+  remaining = sorted(set(titles) - set(titles[::3]))
+
+  with storage.get_engine().connect() as connection:
+    slots = sorted(
+      int(row[0])
+      for row in connection.execute(
+        text("SELECT slot FROM movies WHERE user_id = :user_id"), {"user_id": user}
+      )
+    )
+  assert slots == list(range(len(remaining)))
+  picked = storage.random_movie(user, k=len(remaining) + 5)
+  assert sorted(title for title, _ in picked) == remaining
+  assert len(storage.random_movie(user, k=3, weighted_by="rating")) == 3
+
+
+def test_keyset_pages_cover_every_movie_once(memory_db: None) -> None:
+  user = storage.create_user("alice")
+  for number in range(25):
+    storage.add_movie(user, f"Film {number:02d}", 1990 + number % 4, float(number % 3), "")
+
+  seen = []
+  after = None
+  while True:
+    result = storage.page(user, after=after, limit=7)
+    seen.extend(title for title, _ in result["movies"])
+    after = result["next"]
+    if after is None:
+      break
+  assert seen == sorted(f"Film {number:02d}" for number in range(25))
+  assert [title for title, _ in storage.iter_movies(user, page_size=4)] == seen
+
+  for bad in (0, -1):
+    with pytest.raises(ValueError):
+      storage.page(user, limit=bad)
+    with pytest.raises(ValueError):
+      list(storage.iter_movies(user, page_size=bad))
+
+
+def test_database_ordering_matches_python_sort(memory_db: None) -> None:
+  alice = storage.create_user("alice")
+  bob = storage.create_user("bob")
+  storage.create_user("carol")
+  added = []
+  for number in range(30):
+    title, year, rating = f"Film {number:02d}", 1980 + number % 7, float(number % 5)
+    storage.add_movie(alice, title, year, rating, "")
+    added.append((title, year, rating))
+  storage.add_movie(bob, "Heat", 1995, 8.3, "")
+
+  by_rating = [title for title, _, _ in sorted(added, key=lambda movie: -movie[2])]
+  by_year = [title for title, _, _ in sorted(added, key=lambda movie: movie[1])]
+  assert [title for title, _ in storage.iter_movies(alice, order_by="rating", page_size=4)] == by_rating
+  assert [title for title, _ in storage.iter_movies(alice, order_by="year", page_size=4)] == by_year
+  assert [title for title, _ in storage.top_movies(alice, 5)] == by_rating[:5]
+
+  grouped = dict(storage.iter_movies_grouped([bob, alice, bob + 1], chunk_size=2))
+  assert [title for title, _ in grouped[alice]] == by_rating
+  assert [title for title, _ in grouped[bob]] == ["Heat"]
+  assert grouped[bob + 1] == []
+
+
+def test_migrated_user_rating_survives_catalog_refresh(
+  tmp_path: Path, monkeypatch: pytest.MonkeyPatch,
+) -> None:
+  url = f"sqlite:///{tmp_path / 'movies.db'}"
+  monkeypatch.setattr(storage, "_MIGRATIONS", storage._MIGRATIONS[:4])  # pylint: disable=protected-access
+  storage.configure(url)
+  alice = storage.create_user("alice")
+  with storage.get_engine().begin() as connection:
+    connection.execute(
+      text(
+        "INSERT INTO movies (user_id, title, year, rating, poster)"
+        " VALUES (:user_id, 'Heat', 1995, 8.0, 'heat.jpg')"
+      ),
+      {"user_id": alice},
+    )
+    # update_movie() before the catalog existed: just overwrote the rating
+    connection.execute(text("UPDATE movies SET rating = 3.0 WHERE title = 'Heat'"))
+
+  monkeypatch.undo()
+  storage.configure(url)
+  run = storage.open_refresh_run(0)
+  (entry,) = storage.refresh_candidates(run)
+  storage.save_refresh_batch(
+    run,
+    [{"id": entry["id"], "imdb_id": "tt0113277", "rating": 8.3, "poster": "heat.jpg"}],
+    (entry["refreshed_at"] or 0.0, entry["id"]),
+  )
+  assert storage.get_catalog_movie("tt0113277")["rating"] == 8.3  # type: ignore[index]
+  assert storage.get_movies(alice)["Heat"]["rating"] == 3.0
+  storage.configure()
+
+
+def test_database_id_and_revisions_differ_between_databases(tmp_path: Path) -> None:
+  revisions = []
+  ids = []
+  for name in ("a.db", "b.db"):
+    storage.configure(f"sqlite:///{tmp_path / name}")
+    user = storage.create_user("alice")
+    first = storage.user_revision(user)
+    storage.add_movie(user, "Heat", 1995, 8.3, "")
+    assert storage.user_revision(user) != first
+    assert storage.user_revisions() == {user: storage.user_revision(user)}
+    revisions.append(storage.user_revision(user))
+    ids.append(storage.database_id())
+  storage.configure()
+  assert ids[0] != ids[1]
+  assert revisions[0] != revisions[1]
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from storage.omdb_cache import ResponseCache, title_key
+
+_TITLES = [f"Film {number}" for number in range(50)]
+
+
+def _count_misses(url: str, rounds: int) -> int:
+  cache = ResponseCache(url)
+  try:
+    return sum(
+      cache.get(title_key(title)) is None for _ in range(rounds) for title in _TITLES
+    )
+  finally:
+    cache.close()
+
+
+def test_round_trip_and_expiry(tmp_path: Path) -> None:
+  cache = ResponseCache(f"sqlite:///{tmp_path / 'cache.db'}", ttl=60, negative_ttl=0)
+  try:
+    cache.put(title_key("Heat"), {"Response": "True", "Title": "Heat"})
+    cache.put(title_key("Nope"), {"Response": "False"})
+    assert cache.get(title_key(" heat ")) == {"Response": "True", "Title": "Heat"}
+    assert cache.get(title_key("Nope")) is None
+    assert cache.get(title_key("Missing")) is None
+  finally:
+    cache.close()
+
+
+def test_hits_survive_concurrent_processes(tmp_path: Path) -> None:
+  url = f"sqlite:///{tmp_path / 'cache.db'}"
+  cache = ResponseCache(url)
+  for title in _TITLES:
+    cache.put(title_key(title), {"Response": "True", "Title": title})
+  cache.close()
+
+  with ProcessPoolExecutor(max_workers=4) as executor:
+    misses = list(executor.map(_count_misses, [url] * 4, [10] * 4))
+  assert misses == [0, 0, 0, 0]
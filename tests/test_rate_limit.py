@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import random
+
+import pytest
+
+from rate_limit import Backoff, CircuitBreaker, TokenBucket
+
+
+class FakeClock:
+  def __init__(self) -> None:
+    self.now = 100.0
+
+  def __call__(self) -> float:
+    return self.now
+
+
+def test_token_bucket_allows_burst_then_paces() -> None:
+  clock = FakeClock()
+  bucket = TokenBucket(rate=2.0, capacity=3, clock=clock)
+  assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+  assert bucket.reserve() == pytest.approx(0.5)
+  assert bucket.reserve() == pytest.approx(1.0)
+  clock.now += 10           # refills, but never above capacity
+  assert [bucket.reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+  assert bucket.reserve() == pytest.approx(0.5)
+  with pytest.raises(ValueError):
+    TokenBucket(rate=0)
+
+
+def test_backoff_grows_is_capped_and_honours_retry_after() -> None:
+  backoff = Backoff(base=1.0, factor=2.0, max_delay=5.0, rng=random.Random(1))
+  for attempt in range(6):
+    assert 0.0 <= backoff.delay(attempt) <= min(5.0, 2.0 ** attempt)
+  assert backoff.delay(0, retry_after=3.0) >= 3.0
+  assert backoff.delay(0, retry_after=60.0) == 5.0
+
+
+def test_circuit_breaker_opens_and_recovers_half_open() -> None:
+  clock = FakeClock()
+  breaker = CircuitBreaker(failure_threshold=2, reset_timeout=30.0, clock=clock)
+  breaker.record_failure()
+  assert breaker.state == "closed"
+  breaker.record_failure()
+  assert breaker.state == "open" and not breaker.allow()
+
+  clock.now += 30
+  assert breaker.state == "half_open"
+  assert breaker.allow()
+  assert not breaker.allow()          # only one trial call
+  breaker.record_failure()            # failed trial opens again at once
+  assert breaker.state == "open"
+
+  clock.now += 30
+  assert breaker.allow()
+  breaker.record_success()
+  assert breaker.state == "closed" and breaker.allow()
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+from typing import Iterator
+
+import pytest
+
+import site_builder
+import website_generator
+from storage import movie_storage_sql as storage
+
+TEMPLATE = Path(__file__).resolve().parents[1] / "_static" / "index_template.html"
+
+
+@pytest.fixture
+def site(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Iterator[Path]:
+  static = tmp_path / "_static"
+  static.mkdir()
+  shutil.copy(TEMPLATE, static / TEMPLATE.name)
+  monkeypatch.chdir(tmp_path)
+  storage.configure(f"sqlite:///{tmp_path / 'movies.db'}")
+  yield static
+  storage.configure()
+
+
+def test_page_filename_is_unique_and_never_reserved() -> None:
+  names = ["bob", "Jürgen Test", "users", "Users", "index", "index_template",
+           "%users", "a/b", "a%2Fb", "..", "x\\y"]
+  filenames = [site_builder.page_filename(name) for name in names]
+  assert filenames[:2] == ["bob.html", "Jürgen Test.html"]
+  assert len(set(filenames)) == len(names)
+  for filename in filenames:
+    assert filename.casefold() not in website_generator.RESERVED_FILENAMES
+    assert "/" not in filename and "\\" not in filename
+
+
+def test_build_sites_keeps_index_and_skips_unchanged(site: Path) -> None:
+  for name in ("users", "a/b", "bob"):
+    user = storage.create_user(name)
+    storage.add_movie(user, f"Film of {name}", 2000, 7.0, "")
+
+  report = site_builder.build_sites(jobs=2)
+  assert report == {"users": 3, "written": 3, "unchanged": 0}
+  index = (site / website_generator.INDEX_FILENAME).read_text(encoding="utf-8")
+  assert index.count("<li>") == 3
+  assert "Film of users" in (site / site_builder.page_filename("users")).read_text(encoding="utf-8")
+  assert (site / "a%2Fb.html").exists()
+
+  assert site_builder.build_sites(jobs=1) == {"users": 3, "written": 0, "unchanged": 3}
+  storage.add_movie(storage.get_user_id("bob") or 0, "Alien", 1979, 8.5, "")
+  assert site_builder.build_sites(jobs=1)["written"] == 1
+
+
+def test_build_sites_rejects_jobs_below_one(site: Path) -> None:
+  with pytest.raises(ValueError):
+    site_builder.build_sites(jobs=0)
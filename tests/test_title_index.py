@@ -0,0 +1,50 @@
+from __future__ import annotations
+
+import difflib
+import random
+
+from storage.title_index import MASK_BITS, TitleIndex
+
+
+def _titles(rng: random.Random, count: int) -> list[str]:
+  words = "the dark knight matrix return of king lord rings star wars empire back 2 II: Ä".split()
+  titles = {
+    " ".join(rng.choice(words).capitalize() for _ in range(rng.randint(1, 6)))
+    for _ in range(count)
+  }
+  titles.add("Long " * (MASK_BITS // 4))
+  return sorted(titles)
+
+
+def _typo(rng: random.Random, title: str) -> str:
+  position = rng.randrange(len(title))
+  return title[:position] + rng.choice("aeiouxyz ") + title[position + 1:]
+
+
+def test_close_matches_equal_difflib() -> None:
+  rng = random.Random(8)
+  titles = _titles(rng, 800)
+  index = TitleIndex(titles)
+  queries = [_typo(rng, rng.choice(titles)) for _ in range(40)] + ["", "Long " * 20, "xyz"]
+  for query in queries:
+    for n, cutoff in ((5, 0.6), (3, 0.0), (1, 0.9)):
+      assert index.close_matches(query, n, cutoff) == difflib.get_close_matches(
+        query, titles, n, cutoff
+      )
+
+
+def test_add_and_remove_keep_results_exact() -> None:
+  rng = random.Random(9)
+  pool = _titles(rng, 600)
+  current = set(pool[:200])
+  index = TitleIndex(current)
+  for title in pool[200:]:
+    index.add(title)
+    current.add(title)
+    removed = rng.choice(sorted(current))
+    index.remove(removed)
+    current.discard(removed)
+  assert len(index) == len(current)
+  for _ in range(20):
+    query = _typo(rng, rng.choice(sorted(current)))
+    assert index.close_matches(query) == difflib.get_close_matches(query, current, 5, 0.6)
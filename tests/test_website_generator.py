@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import shutil
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+import pytest
+
+import website_generator
+from storage.movie_storage_sql import MovieRecord
+from website_generator import PageRevision
+
+TEMPLATE = Path(__file__).resolve().parents[1] / "_static" / "index_template.html"
+MOVIES = {"Heat": {"year": 1995, "rating": 8.3, "poster": ""}}
+
+
+class Rows:
+  """(title, record) pairs that remember whether they were read."""
+
+  def __init__(self, movies: dict) -> None:
+    self.items: List[Tuple[str, MovieRecord]] = list(movies.items())
+    self.read = False
+
+  def __iter__(self) -> Iterator[Tuple[str, MovieRecord]]:
+    self.read = True
+    return iter(self.items)
+
+
+@pytest.fixture(autouse=True)
+def static_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+  (tmp_path / "_static").mkdir()
+  shutil.copy(TEMPLATE, tmp_path / "_static" / TEMPLATE.name)
+  monkeypatch.chdir(tmp_path)
+
+
+def test_revision_skip_needs_same_database_and_user() -> None:
+  revision = PageRevision("db-a", 1, 42)
+  assert website_generator.generate_website(MOVIES, "Alice", "alice.html", revision=revision)
+  assert website_generator.page_is_current("Alice", "alice.html", revision)
+
+  rows = Rows(MOVIES)
+  assert not website_generator.generate_website(rows, "Alice", "alice.html", revision=revision)
+  assert not rows.read
+
+  others = [PageRevision("db-b", 1, 42), PageRevision("db-a", 2, 42), PageRevision("db-a", 1, 7)]
+  for other in others:
+    assert not website_generator.page_is_current("Alice", "alice.html", other)
+    rows = Rows({"Alien": {"year": 1979, "rating": 8.5, "poster": ""}})
+    assert website_generator.generate_website(rows, "Alice", "alice.html", revision=other)
+    assert rows.read
+    website_generator.generate_website(MOVIES, "Alice", "alice.html", revision=revision)
+
+
+def test_unchanged_rows_and_force() -> None:
+  assert website_generator.generate_website(MOVIES, "Alice", "alice.html")
+  assert not website_generator.generate_website(MOVIES, "Alice", "alice.html")
+  assert website_generator.generate_website(MOVIES, "Alice", "alice.html", force=True)
+  assert website_generator.generate_website(MOVIES, "Bob", "alice.html")
+  assert not website_generator.page_is_current("Bob", "alice.html", None)
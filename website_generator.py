@@ -3,63 +3,280 @@ website_generator.py - Generate a static website from the movie database.
 
 Reads template from: _static/index_template.html
 Writes output to:    _static/<filename>.html
+Manifests in:        _static/.manifest/<filename>.json
+
+Public API:
+- generate_website(movies, app_title, filename, revision=None, force=False) -> bool
+- page_is_current(app_title, filename, revision) -> bool
+- PageRevision(database_id, user_id, revision)
+- generate_index(users, app_title="Film Datenbank", filename=INDEX_FILENAME)
+- compile_template(text) -> CompiledTemplate
+
+Incremental output: each page has a manifest with a hash of its movie rows,
+the template hash and GENERATOR_VERSION. A page whose inputs did not change
+is not rewritten; if the caller also passes a PageRevision (database id,
+user id and storage revision) and all three match, the rows are not even
+read. Pages and manifests are written to a
+temporary file and renamed into place, so readers never see half a page.
+
+Templates are compiled once per file version into static chunks and named
+slots (__TEMPLATE_<NAME>__) and rendered with a single join. Slots:
+TITLE, MOVIE_GRID, MOVIE_COUNT, AVERAGE_RATING, GENERATED_AT. Unknown
+slots are left in the output unchanged.
 """
 
 from __future__ import annotations
 
+import hashlib
+import json
+import os
+import re
+import tempfile
+import time
 from html import escape
 from pathlib import Path
+from typing import Any, Dict, Iterable, List, Mapping, NamedTuple, Optional, Tuple, Union
+from urllib.parse import quote
 
-from storage.movie_storage_sql import MovieData
+from storage.movie_storage_sql import MovieData, MovieRecord
 
 
 STATIC_DIR = Path("_static")
 TEMPLATE_PATH = STATIC_DIR / "index_template.html"
+MANIFEST_DIR = STATIC_DIR / ".manifest"
+INDEX_FILENAME = "users.html"    # index.html is the sample page
+# Files in STATIC_DIR that user pages must never overwrite.
+RESERVED_FILENAMES = frozenset({INDEX_FILENAME, "index.html", TEMPLATE_PATH.name})
 
+# Bump whenever the generated HTML changes for the same input.
+GENERATOR_VERSION = 2
 
-def _movie_li_html(title: str, year: int, rating: float, poster: str) -> str:
-  safe_title = escape(title)
-  safe_year = escape(str(year))
+_SLOT_PATTERN = re.compile(r"__TEMPLATE_([A-Z0-9_]+)__")
 
-  if poster:
-    safe_poster = escape(poster)
-    poster_html = f'<img class="movie-poster" src="{safe_poster}" alt="{safe_title} poster" />'
-  else:
-    poster_html = (
-      '<div class="movie-poster" style="display:flex;align-items:center;justify-content:center;">'
-      'No poster</div>'
-    )
 
-  return f"""
-<li>
-  <div class="movie">
-    {poster_html}
-    <div class="movie-title">{safe_title}</div>
-    <div class="movie-year">{safe_year}</div>
-  </div>
-</li>
-""".strip()
+class CompiledTemplate(NamedTuple):
+  """A template split at its slots: chunks[0] slots[0] chunks[1] ... chunks[-1]."""
+  chunks: Tuple[str, ...]
+  slots: Tuple[str, ...]
+  sha256: str
+
+  def render(self, values: Mapping[str, str]) -> str:
+    parts = [self.chunks[0]]
+    for slot, chunk in zip(self.slots, self.chunks[1:]):
+      parts.append(values.get(slot, f"__TEMPLATE_{slot}__"))
+      parts.append(chunk)
+    return "".join(parts)
+
+
+class PageRevision(NamedTuple):
+  """Where a page's rows come from: storage.database_id(), the user id and
+  storage.user_revision() of that user."""
+  database_id: str
+  user_id: int
+  revision: int
+
+
+def _is_revision(manifest: Optional[Dict[str, Any]], revision: Optional[PageRevision]) -> bool:
+  return (
+    manifest is not None and revision is not None
+    and manifest.get("revision") == revision._asdict()
+  )
+
+
+def compile_template(text: str) -> CompiledTemplate:
+  pieces = _SLOT_PATTERN.split(text)
+  return CompiledTemplate(
+    chunks=tuple(pieces[0::2]),
+    slots=tuple(pieces[1::2]),
+    sha256=hashlib.sha256(text.encode("utf-8")).hexdigest(),
+  )
+
+
+# path -> (mtime_ns, size, compiled template)
+_template_cache: Dict[Path, Tuple[int, int, CompiledTemplate]] = {}
+
+
+def _load_template(path: Path) -> CompiledTemplate:
+  """Return the compiled template, re-read only when the file changes."""
+  stat = path.stat()
+  cached = _template_cache.get(path)
+  if cached is not None and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+    return cached[2]
+  compiled = compile_template(path.read_text(encoding="utf-8"))
+  _template_cache[path] = (stat.st_mtime_ns, stat.st_size, compiled)
+  return compiled
+
 
+def _write_atomic(path: Path, content: str) -> None:
+  """Write via a temporary file in the same directory and os.replace()."""
+  path.parent.mkdir(parents=True, exist_ok=True)
+  handle, temp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+  try:
+    with os.fdopen(handle, "w", encoding="utf-8") as temp_file:
+      temp_file.write(content)
+    os.replace(temp_name, path)
+  except BaseException:
+    try:
+      os.unlink(temp_name)
+    except OSError:
+      pass
+    raise
 
-def generate_website(movies: MovieData, app_title: str, filename: str) -> None:
+
+def _read_manifest(path: Path) -> Optional[Dict[str, Any]]:
+  try:
+    manifest = json.loads(path.read_text(encoding="utf-8"))
+  except (OSError, ValueError):
+    return None
+  return manifest if isinstance(manifest, dict) else None
+
+
+def _rows_hash(rows: List[Tuple[str, int, float, str]]) -> str:
+  digest = hashlib.sha256()
+  for title, year, rating, poster in rows:
+    digest.update(f"{title}\x1f{year}\x1f{rating!r}\x1f{poster}\x1e".encode("utf-8"))
+  return digest.hexdigest()
+
+
+_NO_POSTER_HTML = (
+  '<div class="movie-poster" style="display:flex;align-items:center;justify-content:center;">'
+  'No poster</div>'
+)
+
+
+def _grid_html(rows: List[Tuple[str, int, float, str]]) -> str:
+  """The <li> items of all movies, built as one list of pieces and one join."""
+  parts: List[str] = []
+  append = parts.append
+  for title, year, _rating, poster in rows:
+    safe_title = escape(title)
+    append('<li>\n  <div class="movie">\n    ')
+    if poster:
+      append('<img class="movie-poster" src="')
+      append(escape(poster))
+      append('" alt="')
+      append(safe_title)
+      append(' poster" />')
+    else:
+      append(_NO_POSTER_HTML)
+    append('\n    <div class="movie-title">')
+    append(safe_title)
+    append('</div>\n    <div class="movie-year">')
+    append(str(year))
+    append("</div>\n  </div>\n</li>\n")
+  return "".join(parts)[:-1]
+
+
+def _page_values(app_title: str, rows: List[Tuple[str, int, float, str]]) -> Dict[str, str]:
+  average = sum(row[2] for row in rows) / len(rows) if rows else None
+  return {
+    "TITLE": escape(app_title),
+    "MOVIE_GRID": _grid_html(rows),
+    "MOVIE_COUNT": str(len(rows)),
+    "AVERAGE_RATING": f"{average:.1f}" if average is not None else "-",
+    "GENERATED_AT": time.strftime("%Y-%m-%d %H:%M"),
+  }
+
+
+def _page_state(
+  app_title: str,
+  filename: str,
+) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]], CompiledTemplate]:
+  """Return (inputs, manifest if it matches inputs and the page exists, template)."""
   if not TEMPLATE_PATH.exists():
     raise FileNotFoundError(f"Template nicht gefunden: {TEMPLATE_PATH}")
+  template = _load_template(TEMPLATE_PATH)
+  inputs = {
+    "generator_version": GENERATOR_VERSION,
+    "template_hash": template.sha256,
+    "app_title": app_title,
+  }
+  manifest = _read_manifest(MANIFEST_DIR / f"{filename}.json")
+  if (
+    manifest is None
+    or any(manifest.get(key) != value for key, value in inputs.items())
+    or not (STATIC_DIR / filename).exists()
+  ):
+    manifest = None
+  return inputs, manifest, template
+
+
+def page_is_current(app_title: str, filename: str, revision: Optional[PageRevision]) -> bool:
+  """True if the page was last generated for this revision with the same inputs."""
+  _, manifest, _ = _page_state(app_title, filename)
+  return _is_revision(manifest, revision)
+
+
+def generate_website(
+  movies: Union[MovieData, Iterable[Tuple[str, MovieRecord]]],
+  app_title: str,
+  filename: str,
+  revision: Optional[PageRevision] = None,
+  force: bool = False,
+) -> bool:
+  """Render the movie grid into the template, unless the page is up to date.
 
-  template = TEMPLATE_PATH.read_text(encoding="utf-8")
+  `movies` is either a mapping (sorted by rating here) or (title, record)
+  pairs already in display order, e.g. storage.iter_movies(..., order_by="rating").
+  With a `revision` (see PageRevision) an unchanged page is skipped before
+  `movies` is iterated. force=True always rewrites.
+  Returns True if the page was written.
+  """
+  inputs, manifest, template = _page_state(app_title, filename)
+  if force:
+    manifest = None
+  if _is_revision(manifest, revision):
+    return False
 
-  sorted_items = sorted(movies.items(), key=lambda item: item[1]["rating"], reverse=True)
-  grid_html = "\n".join(
-    _movie_li_html(
-      title=title,
-      year=int(data["year"]),
-      rating=float(data["rating"]),
-      poster=str(data.get("poster", "")),
+  if isinstance(movies, Mapping):
+    sorted_items: Iterable[Tuple[str, MovieRecord]] = sorted(
+      movies.items(), key=lambda item: item[1]["rating"], reverse=True
     )
+  else:
+    sorted_items = movies
+  rows = [
+    (title, int(data["year"]), float(data["rating"]), str(data.get("poster", "")))
     for title, data in sorted_items
-  )
+  ]
+  content_hash = _rows_hash(rows)
+  new_manifest = {
+    **inputs,
+    "content_hash": content_hash,
+    "revision": revision._asdict() if revision is not None else None,
+  }
+  manifest_path = MANIFEST_DIR / f"{filename}.json"
+  if manifest is not None and manifest.get("content_hash") == content_hash:
+    if manifest.get("revision") != new_manifest["revision"]:
+      _write_atomic(manifest_path, json.dumps(new_manifest))
+    return False
 
-  result_html = template.replace("__TEMPLATE_TITLE__", escape(app_title))
-  result_html = result_html.replace("__TEMPLATE_MOVIE_GRID__", grid_html)
+  _write_atomic(STATIC_DIR / filename, template.render(_page_values(app_title, rows)))
+  _write_atomic(manifest_path, json.dumps(new_manifest))
+  return True
 
-  output_path = STATIC_DIR / filename
-  output_path.write_text(result_html, encoding="utf-8")
+
+def generate_index(
+  users: Iterable[Tuple[str, str, int]],
+  app_title: str = "Film Datenbank",
+  filename: str = INDEX_FILENAME,
+) -> None:
+  """Write a page linking every user's site; `users` are (name, filename, movie count)."""
+  items = "\n".join(
+    f'<li><a href="{escape(quote(page_file))}">{escape(name)}</a> ({count} Filme)</li>'
+    for name, page_file, count in users
+  )
+  _write_atomic(STATIC_DIR / filename, f"""<html>
+<head>
+    <title>{escape(app_title)}</title>
+    <link rel="stylesheet" href="style.css"/>
+</head>
+<body>
+<div class="list-movies-title">
+    <h1>{escape(app_title)}</h1>
+</div>
+<ul>
+{items}
+</ul>
+</body>
+</html>
+""")